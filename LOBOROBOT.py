@@ -10,14 +10,22 @@
 
 import time
 import math
-import smbus2 as smbus
-from gpiozero import LED
+from hardware import create_backend
 
 Dir = [
     'forward',
     'backward',
 ]
 
+# 麦克纳姆轮混合矩阵：每个电机对 (vx 前进, vy 左移, omega 左转) 的系数，
+# 与 t_up / moveLeft / turnLeft 的轮向一致
+MECANUM_MIX = (
+    (1, -1, -1),
+    (1,  1,  1),
+    (1,  1, -1),
+    (1, -1,  1),
+)
+
 class PCA9685:
 
   # Registers/etc.
@@ -34,15 +42,22 @@ class PCA9685:
   __ALLLED_ON_H        = 0xFB
   __ALLLED_OFF_L       = 0xFC
   __ALLLED_OFF_H       = 0xFD
+  __MODE1_AI           = 0x20    # Register auto-increment
     
 
-  def __init__(self, address, debug=False):
-    self.bus = smbus.SMBus(1)
+  def __init__(self, address, debug=False, backend=None):
+    # smbus2 on the Pi, or the simulated bus selected by HARDWARE_BACKEND
+    backend = backend or create_backend()
+    self.bus = backend.SMBus(1)
+    self.i2c_msg = backend.i2c_msg
     self.address = address
     self.debug = debug
+    # Last ON/OFF values written to each channel; unknown channels are absent
+    self.shadow = {}
     if (self.debug):
       print("Reseting PCA9685")
-    self.write(self.__MODE1, 0x00)
+    # Auto-increment lets one block write cover a channel's four registers
+    self.write(self.__MODE1, self.__MODE1_AI)
 
   def write(self, reg, value):
     "Writes an 8-bit value to the specified register/address"
@@ -80,28 +95,74 @@ class PCA9685:
 
   def setPWM(self, channel, on, off):
     "Sets a single PWM channel"
-    self.write(self.__LED0_ON_L + 4*channel, on & 0xFF)
-    self.write(self.__LED0_ON_H + 4*channel, on >> 8)
-    self.write(self.__LED0_OFF_L + 4*channel, off & 0xFF)
-    self.write(self.__LED0_OFF_H + 4*channel, off >> 8)
+    if self.shadow.get(channel) == (on, off):
+      return
+    self.shadow.pop(channel, None)
+    self.bus.write_i2c_block_data(self.address, self.__LED0_ON_L + 4*channel,
+                                  [on & 0xFF, on >> 8, off & 0xFF, off >> 8])
+    self.shadow[channel] = (on, off)
     if (self.debug):
       print("channel: %d  LED_ON: %d LED_OFF: %d" % (channel,on,off))
 
+  def setPWMs(self, values):
+    "Sets several PWM channels, one I2C transaction per run of adjacent channels"
+    changed = {c: v for c, v in values.items() if self.shadow.get(c) != v}
+    channels = sorted(changed)
+    start = 0
+    while start < len(channels):
+      # Extend the run across channels that are unchanged but known, which
+      # is cheaper than starting another transaction
+      run = [channels[start]]
+      end = start + 1
+      while end < len(channels) and all(c in self.shadow for c in range(run[-1] + 1, channels[end])):
+        run += list(range(run[-1] + 1, channels[end] + 1))
+        end += 1
+      run = [(c, changed[c] if c in changed else self.shadow[c]) for c in run]
+      data = [self.__LED0_ON_L + 4*run[0][0]]
+      for channel, (on, off) in run:
+        data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+        # Forget the value until the write succeeds
+        self.shadow.pop(channel, None)
+      # A raw write has no 32-byte SMBus block limit, so a run of any length
+      # goes out as a single transaction
+      self.bus.i2c_rdwr(self.i2c_msg.write(self.address, data))
+      self.shadow.update(run)
+      if (self.debug):
+        print("channels: %d-%d  values: %s" % (run[0][0], run[-1][0], [v for _, v in run]))
+      start = end
+
+  def resync(self):
+    "Reloads the shadow registers from the chip, e.g. after a brownout"
+    write = self.i2c_msg.write(self.address, [self.__LED0_ON_L])
+    read = self.i2c_msg.read(self.address, 16 * 4)
+    self.bus.i2c_rdwr(write, read)
+    data = list(read)
+    self.shadow = {channel: (data[4*channel] | data[4*channel + 1] << 8,
+                             data[4*channel + 2] | data[4*channel + 3] << 8)
+                   for channel in range(16)}
+    if (self.debug):
+      print("Resynced shadow registers: %s" % self.shadow)
+
+  def dutyToPWM(self, pulse):
+    "ON/OFF values for a duty cycle in percent"
+    return (0, int(pulse * (4096 / 100)))
+
+  def levelToPWM(self, value):
+    "ON/OFF values for a fully on or fully off channel"
+    return (0, 4095) if value == 1 else (0, 0)
+
   def setDutycycle(self, channel, pulse):
-    self.setPWM(channel, 0, int(pulse * (4096 / 100)))
+    self.setPWM(channel, *self.dutyToPWM(pulse))
 
   def setLevel(self, channel, value):
-    if (value == 1):
-      self.setPWM(channel, 0, 4095)
-    else:
-      self.setPWM(channel, 0, 0)
+    self.setPWM(channel, *self.levelToPWM(value))
   
 
 
 
 # 控制机器人库
 class LOBOROBOT():
-    def __init__(self):
+    def __init__(self, backend=None):
         self.PWMA = 0
         self.AIN1 = 2
         self.AIN2 = 1
@@ -118,146 +179,166 @@ class LOBOROBOT():
         self.DIN1 = 25        # GPIO口
         self.DIN2 = 24        # GPIO口
         
-        self.pwm = PCA9685(0x40, debug=False)
+        self.backend = backend or create_backend()  # 硬件后端：树莓派或模拟总线
+        self.pwm = PCA9685(0x40, debug=False, backend=self.backend)
         self.pwm.setPWMFreq(50)
-        self.motorD1 = LED(self.DIN1)  # 方向口1，设置为输出模式为LED类型
-        self.motorD2 = LED(self.DIN2)  # 方向口2，设置为输出模式为LED类型
+        self.motorD1 = self.backend.LED(self.DIN1)  # 方向口1，设置为输出模式为LED类型
+        self.motorD2 = self.backend.LED(self.DIN2)  # 方向口2，设置为输出模式为LED类型
+        self.motorDForward = None      # 电机D方向口的影子状态，None 表示未知
 
-    def MotorRun(self, motor, index, speed):
-        if speed > 100:
-            return
-        if(motor == 0):
-            self.pwm.setDutycycle(self.PWMA, speed)
-            if(index == Dir[0]):
-                self.pwm.setLevel(self.AIN1, 0)
-                self.pwm.setLevel(self.AIN2, 1)
-            else:
-                self.pwm.setLevel(self.AIN1, 1)
-                self.pwm.setLevel(self.AIN2, 0)
-        elif(motor == 1):
-            self.pwm.setDutycycle(self.PWMB, speed)
-            if(index == Dir[0]):
-                self.pwm.setLevel(self.BIN1, 1)
-                self.pwm.setLevel(self.BIN2, 0)
-            else:
-                self.pwm.setLevel(self.BIN1, 0)
-                self.pwm.setLevel(self.BIN2, 1)
-        elif(motor == 2):
-            self.pwm.setDutycycle(self.PWMC,speed)
-            if(index == Dir[0]):
-                self.pwm.setLevel(self.CIN1,1)
-                self.pwm.setLevel(self.CIN2,0)
-            else:
-                self.pwm.setLevel(self.CIN1,0)
-                self.pwm.setLevel(self.CIN2,1)
-        elif(motor == 3):
-            self.pwm.setDutycycle(self.PWMD,speed)
-            if (index == Dir[0]):
-                self.motorD1.off()    # DIn1设置为低电平
-                self.motorD2.on()     # DIn2设置为高电平
-                #GPIO.output(self.DIN1,0)
-                #GPIO.output(self.DIN2,1)
+        # PCA9685 通道：(PWM, IN1, IN2, 前进时 IN1/IN2 电平)
+        self.motorChannels = {
+            0: (self.PWMA, self.AIN1, self.AIN2, (0, 1)),
+            1: (self.PWMB, self.BIN1, self.BIN2, (1, 0)),
+            2: (self.PWMC, self.CIN1, self.CIN2, (1, 0)),
+        }
+
+    def setMotors(self, commands):
+        """
+        Update several motors with one batched PCA9685 write.
+
+        commands maps a motor number to (direction, speed), or to None to
+        stop that motor. Motors that are not listed are left untouched.
+        """
+        values = {}
+        gpio = None
+        for motor, command in commands.items():
+            if command is None:
+                values[self.PWMD if motor == 3 else self.motorChannels[motor][0]] = self.pwm.dutyToPWM(0)
+                continue
+            index, speed = command
+            if speed > 100:
+                continue
+            forward = (index == Dir[0])
+            if motor == 3:
+                values[self.PWMD] = self.pwm.dutyToPWM(speed)
+                gpio = forward
+                continue
+            pwm, in1, in2, levels = self.motorChannels[motor]
+            values[pwm] = self.pwm.dutyToPWM(speed)
+            values[in1] = self.pwm.levelToPWM(levels[0] if forward else 1 - levels[0])
+            values[in2] = self.pwm.levelToPWM(levels[1] if forward else 1 - levels[1])
+
+        if values:
+            self.pwm.setPWMs(values)
+        if gpio is not None and gpio != self.motorDForward:
+            self.setMotorDDirection(gpio)
+
+    def setMotorDDirection(self, forward):
+        self.motorDForward = None
+        if forward:
+            self.motorD1.off()    # DIn1设置为低电平
+            self.motorD2.on()     # DIn2设置为高电平
+        else:
+            self.motorD1.on()    # DIn1设置为高电平
+            self.motorD2.off()   # DIn2设置为低电平
+        self.motorDForward = forward
+
+    def resync(self):
+        """
+        Bring the shadow state back in line with the hardware.
+
+        The PCA9685 registers are read back from the chip and the motor D
+        direction pins are rewritten from their shadow state. Call after an
+        I2C error or anything else that may have changed the outputs behind
+        our back.
+        """
+        self.pwm.resync()
+        if self.motorDForward is not None:
+            self.setMotorDDirection(self.motorDForward)
+
+    def mix_velocity(self, vx, vy, omega, speed=100):
+        """
+        Wheel duty cycles for a continuous body velocity.
+
+        vx (forward), vy (left) and omega (counter-clockwise) range from -1
+        to 1. The four wheel speeds are mixed in one step and scaled down
+        together if any exceeds full speed. Returns signed duty cycles,
+        with speed as the duty cycle of the fastest wheel.
+        """
+        v = [max(-1.0, min(1.0, float(a))) for a in (vx, vy, omega)]
+        wheels = [m[0] * v[0] + m[1] * v[1] + m[2] * v[2] for m in MECANUM_MIX]
+        peak = max(1.0, max(abs(w) for w in wheels))
+        return [w / peak * speed for w in wheels]
+
+    def set_wheels(self, duties):
+        """Set all four wheels from signed duty cycles in one batched update."""
+        commands = {}
+        for motor, duty in enumerate(duties):
+            if abs(duty) < 1:
+                commands[motor] = None
             else:
-                self.motorD1.on()    # DIn1设置为高电平
-                self.motorD2.off()   # DIn2设置为低电平
-                #GPIO.output(self.DIN1,1)
-                #GPIO.output(self.DIN2,0)
+                commands[motor] = (Dir[0] if duty > 0 else Dir[1], int(round(abs(duty))))
+        self.setMotors(commands)
+
+    def set_velocity(self, vx, vy, omega, speed=100):
+        """Drive with a continuous body velocity, see mix_velocity."""
+        self.set_wheels(self.mix_velocity(vx, vy, omega, speed))
+
+    def MotorRun(self, motor, index, speed):
+        self.setMotors({motor: (index, speed)})
 
     def MotorStop(self, motor):
-        if (motor == 0):
-            self.pwm.setDutycycle(self.PWMA, 0)
-        elif(motor == 1):
-            self.pwm.setDutycycle(self.PWMB, 0)
-        elif(motor == 2):
-            self.pwm.setDutycycle(self.PWMC, 0)
-        elif(motor == 3):
-            self.pwm.setDutycycle(self.PWMD, 0)
+        self.setMotors({motor: None})
     # 前进
     def t_up(self,speed,t_time):
-        self.MotorRun(0,'forward',speed)
-        self.MotorRun(1,'forward',speed)
-        self.MotorRun(2,'forward',speed)
-        self.MotorRun(3,'forward',speed)
+        self.setMotors({0: ('forward', speed), 1: ('forward', speed),
+                        2: ('forward', speed), 3: ('forward', speed)})
         time.sleep(t_time)
     #后退
     def t_down(self,speed,t_time):
-        self.MotorRun(0,'backward',speed)
-        self.MotorRun(1,'backward',speed)
-        self.MotorRun(2,'backward',speed)
-        self.MotorRun(3,'backward',speed)
+        self.setMotors({0: ('backward', speed), 1: ('backward', speed),
+                        2: ('backward', speed), 3: ('backward', speed)})
         time.sleep(t_time)
 
     # 左移
     def moveLeft(self,speed,t_time):
-        self.MotorRun(0,'backward',speed)
-        self.MotorRun(1,'forward',speed)
-        self.MotorRun(2,'forward',speed)
-        self.MotorRun(3,'backward',speed)
+        self.setMotors({0: ('backward', speed), 1: ('forward', speed),
+                        2: ('forward', speed), 3: ('backward', speed)})
         time.sleep(t_time)
 
     #右移
     def moveRight(self,speed,t_time):
-        self.MotorRun(0,'forward',speed)
-        self.MotorRun(1,'backward',speed)
-        self.MotorRun(2,'backward',speed)
-        self.MotorRun(3,'forward',speed)
+        self.setMotors({0: ('forward', speed), 1: ('backward', speed),
+                        2: ('backward', speed), 3: ('forward', speed)})
         time.sleep(t_time)
 
     # 左转
     def turnLeft(self,speed,t_time):
-        self.MotorRun(0,'backward',speed)
-        self.MotorRun(1,'forward',speed)
-        self.MotorRun(2,'backward',speed)
-        self.MotorRun(3,'forward',speed)
+        self.setMotors({0: ('backward', speed), 1: ('forward', speed),
+                        2: ('backward', speed), 3: ('forward', speed)})
         time.sleep(t_time)
     
     # 右转
     def turnRight(self,speed,t_time):
-        self.MotorRun(0,'forward',speed)
-        self.MotorRun(1,'backward',speed)
-        self.MotorRun(2,'forward',speed)
-        self.MotorRun(3,'backward',speed)
+        self.setMotors({0: ('forward', speed), 1: ('backward', speed),
+                        2: ('forward', speed), 3: ('backward', speed)})
         time.sleep(t_time)
     
     # 前左斜
     def forward_Left(self,speed,t_time):
-        self.MotorStop(0)
-        self.MotorRun(1,'forward',speed)
-        self.MotorRun(2,'forward',speed)
-        self.MotorStop(0)
+        self.setMotors({0: None, 1: ('forward', speed), 2: ('forward', speed)})
         time.sleep(t_time)
 
     # 前右斜
     def forward_Right(self,speed,t_time):
-        self.MotorRun(0,'forward',speed)
-        self.MotorStop(1)
-        self.MotorStop(2)
-        self.MotorRun(3,'forward',speed)
+        self.setMotors({0: ('forward', speed), 1: None, 2: None, 3: ('forward', speed)})
         time.sleep(t_time)
 
     # 后左斜
     def backward_Left(self,speed,t_time):
-        self.MotorRun(0,'backward',speed)
-        self.MotorStop(1)
-        self.MotorStop(2)
-        self.MotorRun(3,'backward',speed)
+        self.setMotors({0: ('backward', speed), 1: None, 2: None, 3: ('backward', speed)})
         time.sleep(t_time)
     
     # 后右斜
     def backward_Right(self,speed,t_time):
-        self.MotorStop(0)
-        self.MotorRun(1,'backward',speed)
-        self.MotorRun(2,'backward',speed)
-        self.MotorStop(3)
+        self.setMotors({0: None, 1: ('backward', speed), 2: ('backward', speed), 3: None})
         time.sleep(t_time)
 
 
     # 停止
     def t_stop(self,t_time):
-        self.MotorStop(0)
-        self.MotorStop(1)
-        self.MotorStop(2)
-        self.MotorStop(3)
+        self.setMotors({0: None, 1: None, 2: None, 3: None})
         time.sleep(t_time)
 
         # 辅助功能，使设置舵机脉冲宽度更简单。
@@ -271,7 +352,14 @@ class LOBOROBOT():
         pulse //= pulse_length
         self.pwm.setPWM(channel, 0, pulse)
 
+    # 舵机角度对应的 PCA9685 计数值（0.5ms-2.5ms 脉宽，50Hz）
+    def servo_pwm(self,angle):
+        return int(4096*((angle*11)+500)/20000)
+
     # 设置舵机角度函数  
     def set_servo_angle(self,channel,angle):
-        angle=4096*((angle*11)+500)/20000
-        self.pwm.setPWM(channel,0,int(angle))
+        self.pwm.setPWM(channel,0,self.servo_pwm(angle))
+
+    # 一次批量写入设置多个舵机角度，angles 为 {通道: 角度}
+    def set_servo_angles(self,angles):
+        self.pwm.setPWMs({channel: (0, self.servo_pwm(angle)) for channel, angle in angles.items()})
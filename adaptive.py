@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Number of steps between the configured ceilings and floors
+QUALITY_LEVELS = 6
+# Length of a measurement window in seconds
+WINDOW = 1.0
+# Consecutive healthy windows required before stepping quality back up
+UPGRADE_WINDOWS = 3
+
+
+class AdaptiveStreamController:
+    """
+    Per-viewer controller for JPEG quality, output scale and frame rate.
+
+    Settings move along a ladder of levels running from the configured
+    ceilings (level 0) to the configured floors (last level). Once per
+    measurement window the controller looks at how long the viewer took to
+    acknowledge frames, how many frames had to be dropped and what the client
+    reported about its own rendering. A congested window steps one level
+    down; several healthy windows in a row step one level back up. Moving a
+    single step at a time gives smooth degradation instead of a frozen feed.
+    """
+
+    def __init__(self, config=None):
+        """Initialize the controller with configuration settings."""
+        self.config = config or Config()
+        self.levels = self._build_levels()
+        self.level = 0
+        self.healthy_windows = 0
+        self._reset_window(time.monotonic())
+
+    def _build_levels(self):
+        """Build the quality ladder from the configured ceilings and floors."""
+        cfg = self.config
+        if not cfg.STREAM_ADAPTIVE:
+            return [(cfg.STREAM_QUALITY_MAX, cfg.STREAM_SCALE_MAX, cfg.STREAM_FPS_MAX)]
+
+        levels = []
+        for i in range(QUALITY_LEVELS):
+            t = i / (QUALITY_LEVELS - 1)
+            quality = cfg.STREAM_QUALITY_MAX + (cfg.STREAM_QUALITY_MIN - cfg.STREAM_QUALITY_MAX) * t
+            scale = cfg.STREAM_SCALE_MAX + (cfg.STREAM_SCALE_MIN - cfg.STREAM_SCALE_MAX) * t
+            fps = cfg.STREAM_FPS_MAX + (cfg.STREAM_FPS_MIN - cfg.STREAM_FPS_MAX) * t
+            # Quantize so viewers at nearby levels share encodes
+            levels.append((int(round(quality / 5.0) * 5),
+                           round(scale * 20) / 20.0,
+                           max(1, int(round(fps)))))
+        return levels
+
+    def _reset_window(self, now):
+        self.window_start = now
+        self.ack_times = []
+        self.decode_times = []
+        self.render_times = []
+        self.sent = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.gated = 0
+
+    @property
+    def quality(self):
+        return self.levels[self.level][0]
+
+    @property
+    def scale(self):
+        return self.levels[self.level][1]
+
+    @property
+    def fps(self):
+        return self.levels[self.level][2]
+
+    def record_send(self):
+        """Record that a frame was sent to the viewer."""
+        self.sent += 1
+
+    def record_drop(self):
+        """Record that a frame was replaced before it could be sent."""
+        self.dropped += 1
+
+    def record_timeout(self):
+        """Record that a frame was never acknowledged."""
+        self.timeouts += 1
+
+    def record_gated(self):
+        """Record that a due frame was not sent because the scene was static."""
+        self.gated += 1
+
+    def record_ack(self, round_trip, report=None):
+        """
+        Record a frame acknowledgement.
+
+        Args:
+            round_trip (float): Seconds between sending and acknowledgement
+            report (dict): Optional client report with 'rendered_at'
+                (client clock, ms) and 'decode_ms'
+        """
+        self.ack_times.append(round_trip)
+        if isinstance(report, dict):
+            if isinstance(report.get('decode_ms'), (int, float)):
+                self.decode_times.append(report['decode_ms'])
+            if isinstance(report.get('rendered_at'), (int, float)):
+                self.render_times.append(report['rendered_at'])
+
+    def is_congested(self):
+        """Decide whether the last window shows a link or client struggling."""
+        target = self.config.STREAM_LATENCY_TARGET_MS / 1000.0
+        frame_interval_ms = 1000.0 / self.fps
+
+        if self.timeouts:
+            return True
+        if self.ack_times:
+            ack_times = sorted(self.ack_times)
+            if ack_times[int(len(ack_times) * 0.9)] > target:
+                return True
+        attempts = self.sent + self.dropped
+        if attempts and self.dropped / attempts > 0.5:
+            return True
+        if self.decode_times and sum(self.decode_times) / len(self.decode_times) > frame_interval_ms:
+            return True
+        if len(self.render_times) > 2 and not self.gated:
+            # Rendering far below the rate we are sending means the client
+            # cannot keep up even if the network can. While the motion gate
+            # holds frames back the client renders less by design, so such
+            # windows say nothing about it.
+            span = (self.render_times[-1] - self.render_times[0]) / 1000.0
+            if span > 0 and (len(self.render_times) - 1) / span < self.fps * 0.5:
+                return True
+        return False
+
+    def is_healthy(self):
+        """Decide whether the last window leaves room for better quality."""
+        target = self.config.STREAM_LATENCY_TARGET_MS / 1000.0
+        if not self.ack_times:
+            return False
+        attempts = self.sent + self.dropped
+        if attempts and self.dropped / attempts > 0.1:
+            return False
+        return sum(self.ack_times) / len(self.ack_times) < target / 2
+
+    def update(self, now=None):
+        """
+        Re-evaluate the settings once per measurement window.
+
+        Returns:
+            bool: True if the settings changed
+        """
+        now = now or time.monotonic()
+        if now - self.window_start < WINDOW:
+            return False
+
+        previous = self.level
+        if self.is_congested():
+            self.level = min(self.level + 1, len(self.levels) - 1)
+            self.healthy_windows = 0
+        elif self.is_healthy():
+            self.healthy_windows += 1
+            if self.healthy_windows >= UPGRADE_WINDOWS:
+                self.level = max(self.level - 1, 0)
+                self.healthy_windows = 0
+        else:
+            self.healthy_windows = 0
+
+        self._reset_window(now)
+        if self.level != previous:
+            logger.info(f"Stream level {previous} -> {self.level}: "
+                        f"quality={self.quality} scale={self.scale} fps={self.fps}")
+            return True
+        return False
+
+    def get_settings(self):
+        """Return the current encoder settings."""
+        return {
+            'level': self.level,
+            'quality': self.quality,
+            'scale': self.scale,
+            'fps': self.fps
+        }
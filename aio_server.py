@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Asyncio server mode: the same routes and Socket.IO events as app.py,
+served by aiohttp and python-socketio's AsyncServer.
+
+The robot, camera and AI components are the ones app.py builds on import;
+only the web layer differs. Control events are cheap (they post setpoints
+to the controller threads) and run on the event loop. Everything that can
+block is handed to an explicit executor: speech recognition, the AI model
+and text-to-speech to SERVER_ML_WORKERS threads, stream start/stop and
+WebRTC signalling to SERVER_IO_WORKERS threads, and disconnects to their
+own SERVER_SESSION_WORKERS threads so a busy pool cannot delay stopping the
+robot. MJPEG viewers wait for frames on the event loop and hold no thread.
+A slow model call therefore never holds up a viewer or the control stream.
+
+    python aio_server.py
+"""
+
+import os
+import ssl
+import asyncio
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from flask import render_template
+import socketio
+import app as shared
+from config import Config
+from streaming import ACK_TIMEOUT, mjpeg_part
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+web_app = web.Application()
+sio.attach(web_app)
+
+ml_executor = ThreadPoolExecutor(max_workers=Config.SERVER_ML_WORKERS, thread_name_prefix='ml')
+io_executor = ThreadPoolExecutor(max_workers=Config.SERVER_IO_WORKERS, thread_name_prefix='io')
+session_executor = ThreadPoolExecutor(max_workers=Config.SERVER_SESSION_WORKERS,
+                                      thread_name_prefix='session')
+
+
+class ThreadsafeEmitter:
+    """
+    Stand-in for flask_socketio.SocketIO.emit that any thread can call.
+
+    The frame broadcaster and the AI readiness announcement emit from their
+    own threads; the emit is scheduled on the event loop without waiting.
+    """
+
+    def __init__(self, server, loop):
+        self.server = server
+        self.loop = loop
+
+    def emit(self, event, data=None, to=None, callback=None):
+        asyncio.run_coroutine_threadsafe(
+            self.server.emit(event, data, to=to, callback=callback), self.loop)
+
+
+def announce_if_ready():
+    """Announce the AI model from the ML executor once it is ready."""
+    if shared.ai_assistant and not shared.ai_ready_announced and shared.ai_assistant.is_model_ready():
+        asyncio.get_running_loop().run_in_executor(ml_executor, shared.announce_ai_ready)
+
+
+# HTTP routes
+
+async def index(request):
+    """Render the main web interface."""
+    return web.Response(text=request.app['index_html'], content_type='text/html')
+
+
+async def get_status(request):
+    """Get the current status of the robot."""
+    announce_if_ready()
+    return web.json_response(shared.get_status_data())
+
+
+async def set_speed(request):
+    """Set the movement speed of the robot."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if shared.update_speed(data):
+        return web.json_response({'success': True, 'speed': shared.current_speed})
+    return web.json_response({'success': False, 'message': 'Invalid speed value'}, status=400)
+
+
+async def video_feed(request):
+    """Serve the camera as multipart MJPEG for plain <img> tags and ffmpeg."""
+    if not shared.broadcaster:
+        return web.json_response({'success': False, 'message': 'Camera not available'}, status=404)
+
+    viewer_id = f"mjpeg-{uuid.uuid4().hex[:8]}"
+    logger.info(f"MJPEG client connected: {request.remote} ({viewer_id})")
+    response = web.StreamResponse(headers={
+        'Content-Type': 'multipart/x-mixed-replace; boundary=frame'})
+    await response.prepare(request)
+
+    # The broadcaster wakes this coroutine whenever it offers the viewer a
+    # frame, so waiting costs no executor thread however many viewers watch
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def notify():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    # Subscribing starts the camera for the first viewer
+    await loop.run_in_executor(session_executor, shared.broadcaster.subscribe, viewer_id, 'pull')
+    try:
+        viewer = shared.broadcaster.get_viewer(viewer_id)
+        if viewer is None:
+            return response
+        viewer.listener = notify
+        ready.set()
+        while viewer.is_active:
+            try:
+                await asyncio.wait_for(ready.wait(), ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue
+            ready.clear()
+            frame = viewer.take_frame()
+            if frame is not None:
+                await response.write(mjpeg_part(frame))
+                # The write time stands in for the ack round trip
+                viewer.acknowledge()
+    except ConnectionResetError:
+        pass
+    finally:
+        await loop.run_in_executor(session_executor, shared.broadcaster.unsubscribe, viewer_id)
+    return response
+
+
+async def webrtc_offer(request):
+    """Exchange an SDP offer for an answer carrying the camera track."""
+    if not shared.webrtc:
+        return web.json_response({'success': False, 'message': 'WebRTC not available'}, status=404)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or 'sdp' not in data:
+        return web.json_response({'success': False, 'message': 'Missing SDP offer'}, status=400)
+
+    try:
+        answer = await asyncio.get_running_loop().run_in_executor(
+            io_executor, shared.webrtc.handle_offer, data['sdp'], data.get('type', 'offer'))
+        return web.json_response({'success': True, 'sdp': answer['sdp'], 'type': answer['type']})
+    except Exception as e:
+        logger.error(f"WebRTC signalling error: {e}")
+        return web.json_response({'success': False, 'message': f'WebRTC error: {str(e)}'},
+                                 status=500)
+
+
+async def get_stream_stats(request):
+    """Get capture pacing and per-viewer video delivery statistics."""
+    if not shared.broadcaster:
+        return web.json_response({'success': False, 'message': 'Camera not available'}, status=404)
+    return web.json_response(shared.get_stream_stats_data())
+
+
+async def get_stream_latency(request):
+    """Get rolling latency histograms per video stage and per viewer."""
+    if not shared.broadcaster:
+        return web.json_response({'success': False, 'message': 'Camera not available'}, status=404)
+    latency = shared.broadcaster.telemetry.get_stats()
+    return web.json_response({'success': True, 'stages': latency['stages'],
+                              'viewers': latency['viewers']})
+
+
+async def dump_blackbox(request):
+    """Write the recent video and commands from the black box to disk."""
+    if not shared.recorder:
+        return web.json_response({'success': False, 'message': 'Black box recorder not available'},
+                                 status=404)
+    path = shared.recorder.dump('manual', force=True)
+    if not path:
+        return web.json_response({'success': False, 'message': 'A dump is already in progress'},
+                                 status=409)
+    return web.json_response({'success': True, 'path': path})
+
+
+# Socket.IO events
+
+@sio.event
+async def connect(sid, environ):
+    """Handle client connection."""
+    logger.info(f"Client connected: {sid}")
+    announce_if_ready()
+    await sio.emit('status', {'connected': True}, to=sid)
+
+
+@sio.event
+async def disconnect(sid):
+    """Handle client disconnection."""
+    # Stops the robot and possibly the camera; kept off the busier IO pool
+    await asyncio.get_running_loop().run_in_executor(session_executor,
+                                                     shared.client_disconnected, sid)
+
+
+def toggle_tts(sid, data):
+    enabled = data.get('enabled', True)
+    message = "Text-to-speech enabled" if enabled else "Text-to-speech disabled"
+    return 'tts_status', {'success': True, 'enabled': enabled, 'message': message}
+
+
+def update_tts_settings(sid, data):
+    shared.handle_update_tts_settings(data)
+    return None
+
+
+# event -> (handler(sid, data) returning (event, payload) or None, executor);
+# handlers without an executor do not block and run on the event loop
+EVENTS = {
+    'movement': (lambda sid, data: shared.process_movement(data, sid), None),
+    'control': (lambda sid, data: shared.process_control(data, sid), None),
+    'velocity': (lambda sid, data: shared.process_velocity(data, sid), None),
+    'camera_control': (lambda sid, data: shared.process_camera_control(data, sid), None),
+    'start_stream': (lambda sid, data: shared.process_start_stream(data, sid), io_executor),
+    'stop_stream': (lambda sid, data: shared.process_stop_stream(sid), io_executor),
+    'voice_command': (lambda sid, data: shared.process_voice_command(data, sid), ml_executor),
+    'text_command': (lambda sid, data: shared.process_text_command(data, sid), ml_executor),
+    'test_tts': (lambda sid, data: shared.process_tts_test(data), ml_executor),
+    'toggle_tts': (toggle_tts, None),
+    'update_tts_settings': (update_tts_settings, None),
+    'get_tts_settings': (lambda sid, data: ('tts_settings', shared.tts_settings), None)
+}
+
+
+def register_event(event, handler, executor):
+    async def on_event(sid, data=None):
+        try:
+            if executor is None:
+                reply = handler(sid, data)
+            else:
+                reply = await asyncio.get_running_loop().run_in_executor(executor, handler, sid, data)
+        except Exception as e:
+            logger.error(f"Error handling {event}: {e}", exc_info=True)
+            reply = 'error', {'message': f'{event} error: {str(e)}'}
+        if reply:
+            await sio.emit(reply[0], reply[1], to=sid)
+    sio.on(event, on_event)
+
+
+for event, (handler, executor) in EVENTS.items():
+    register_event(event, handler, executor)
+
+
+async def on_startup(app):
+    # Server-initiated emits from worker threads now go to this server
+    shared.emitter = ThreadsafeEmitter(sio, asyncio.get_running_loop())
+    if shared.broadcaster:
+        shared.broadcaster.socketio = shared.emitter
+
+
+async def on_cleanup(app):
+    await asyncio.get_running_loop().run_in_executor(None, shared.shutdown)
+    ml_executor.shutdown(wait=False)
+    io_executor.shutdown(wait=False)
+    session_executor.shutdown(wait=False)
+
+
+def create_app():
+    """Build the aiohttp application."""
+    # The page is rendered once with the Flask templates and url_for
+    with shared.app.test_request_context('/'):
+        web_app['index_html'] = render_template('index.html')
+
+    web_app.router.add_get('/', index)
+    web_app.router.add_get('/api/status', get_status)
+    web_app.router.add_post('/api/speed', set_speed)
+    web_app.router.add_get('/video_feed', video_feed)
+    web_app.router.add_post('/api/webrtc/offer', webrtc_offer)
+    web_app.router.add_get('/api/stream/stats', get_stream_stats)
+    web_app.router.add_get('/api/stream/latency', get_stream_latency)
+    web_app.router.add_post('/api/blackbox/dump', dump_blackbox)
+    web_app.router.add_static('/static', shared.app.static_folder)
+    web_app.on_startup.append(on_startup)
+    web_app.on_cleanup.append(on_cleanup)
+    return web_app
+
+
+if __name__ == '__main__':
+    ssl_context = None
+    cert_file = 'cert.pem'
+    key_file = 'key.pem'
+
+    if os.path.exists(cert_file) and os.path.exists(key_file):
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(cert_file, key_file)
+        logger.info("SSL certificates found. Starting asyncio server with HTTPS support.")
+    else:
+        logger.info("SSL certificates not found. Starting asyncio server without HTTPS.")
+
+    web.run_app(create_app(), host='0.0.0.0', port=5000, ssl_context=ssl_context)
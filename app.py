@@ -5,13 +5,20 @@ import os
 import json
 import logging
 import asyncio
+import uuid
 import threading
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 import time
 from LOBOROBOT import LOBOROBOT
+from drive import MotionController, InputCoalescer, DIRECTIONS, offer_movement, velocity_axis
+from bus_worker import BusWorker
+from gimbal import GimbalController
+from control import ControlReceiver, FLAG_ACK, FLAG_DRIVE, FLAG_GIMBAL, FLAG_STOP
 from config import Config
 from camera import Camera
+from streaming import FrameBroadcaster
+from blackbox import BlackBoxRecorder, BlackBoxFeed
 from voice import VoiceRecognition
 from ai_assistant import AIAssistant
 from speech import TextToSpeech
@@ -25,6 +32,9 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config.from_object(Config)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# Server-initiated events go through this; the asyncio server (aio_server.py)
+# replaces it with its own Socket.IO server
+emitter = socketio
 
 # Initialize robot controller
 try:
@@ -34,6 +44,32 @@ except Exception as e:
     logger.error(f"Failed to initialize robot controller: {e}")
     robot = None
 
+# One thread owns the I2C bus; all drive commands go through the motion
+# controller thread
+bus = BusWorker() if robot else None
+motion = MotionController(robot, bus=bus) if robot else None
+gimbal = GimbalController(robot, bus=bus) if robot else None
+
+# A client's movement input is dropped if a newer one was already applied
+inputs = InputCoalescer(motion.apply) if motion else None
+
+def control_stop(sid, message):
+    inputs.offer(sid, ('movement', 'stop', current_speed, None), urgent=True)
+
+def control_drive(sid, message):
+    inputs.offer(sid, ('velocity', message.vx, message.vy, message.omega, current_speed, None),
+                 urgent=not (message.vx or message.vy or message.omega))
+
+def control_gimbal(sid, message):
+    gimbal.set_pose(message.pan, message.tilt)
+
+# Binary control frames from the joystick, dispatched by flag
+control = ControlReceiver({
+    FLAG_STOP: control_stop,
+    FLAG_DRIVE: control_drive,
+    FLAG_GIMBAL: control_gimbal
+}) if robot else None
+
 # Initialize camera
 try:
     camera = Camera()
@@ -42,6 +78,36 @@ except Exception as e:
     logger.error(f"Failed to initialize camera: {e}")
     camera = None
 
+# Initialize the black box recorder
+recorder = None
+if Config.BLACKBOX_ENABLED:
+    try:
+        recorder = BlackBoxRecorder()
+    except Exception as e:
+        logger.error(f"Failed to initialize black box recorder: {e}")
+        recorder = None
+
+# Record video into the black box whether or not anyone is watching
+recorder_feed = BlackBoxFeed(camera, recorder) if camera and recorder else None
+
+# Initialize the video broadcaster shared by all viewers
+broadcaster = FrameBroadcaster(emitter, camera, recorder) if camera else None
+
+# Initialize WebRTC (JPEG streaming stays available as a fallback)
+webrtc = None
+if camera and Config.WEBRTC_ENABLED:
+    try:
+        # aiortc and av are optional; only load them when WebRTC is wanted
+        from webrtc import WebRTCManager
+        webrtc = WebRTCManager(camera)
+        logger.info("WebRTC initialized successfully")
+    except ImportError as e:
+        logger.error(f"WebRTC unavailable, missing dependency: {e}")
+        webrtc = None
+    except Exception as e:
+        logger.error(f"Failed to initialize WebRTC: {e}")
+        webrtc = None
+
 # Initialize voice recognition
 try:
     voice = VoiceRecognition()
@@ -74,8 +140,6 @@ except Exception as e:
 
 # Global variables
 current_speed = 50  # Default speed (0-100)
-is_streaming = False
-streaming_thread = None
 ai_ready_announced = False  # Flag to track if we've announced AI readiness
 ai_ready_check_thread = None  # Thread for checking AI readiness
 
@@ -113,7 +177,7 @@ def announce_ai_ready():
     
     # Send the ready message to all connected clients
     try:
-        socketio.emit('ai_ready', {
+        emitter.emit('ai_ready', {
             'message': ready_message
         })
     except Exception as e:
@@ -164,27 +228,106 @@ def get_status():
         # Schedule the announcement to happen shortly after this request
         socketio.start_background_task(announce_ai_ready)
     
-    status = {
+    return jsonify(get_status_data())
+
+def get_status_data():
+    """Status of every subsystem, shared by both server modes."""
+    return {
         'robot': robot is not None,
         'camera': camera is not None,
         'voice': voice is not None,
         'ai': ai_assistant is not None and ai_assistant.is_model_ready(),
         'speed': current_speed,
-        'streaming': is_streaming
+        'motion': motion.get_stats() if motion else None,
+        'inputs': inputs.get_stats() if inputs else None,
+        'control': control.get_stats() if control else None,
+        'hardware': robot.backend.get_stats() if robot else None,
+        'bus': bus.get_stats() if bus else None,
+        'gimbal': gimbal.get_stats() if gimbal else None,
+        'streaming': broadcaster is not None and broadcaster.is_streaming,
+        'viewers': broadcaster.viewer_count() if broadcaster else 0,
+        'webrtc': webrtc is not None,
+        'ice_servers': webrtc.get_ice_servers() if webrtc else []
     }
-    return jsonify(status)
 
 @app.route('/api/speed', methods=['POST'])
 def set_speed():
     """Set the movement speed of the robot."""
+    if update_speed(request.json):
+        return jsonify({'success': True, 'speed': current_speed})
+    return jsonify({'success': False, 'message': 'Invalid speed value'}), 400
+
+def update_speed(data):
+    """Apply {'speed': 0-100}; returns False if the value is invalid."""
     global current_speed
-    data = request.json
-    if 'speed' in data:
+    if data and 'speed' in data:
         speed = int(data['speed'])
         if 0 <= speed <= 100:
             current_speed = speed
-            return jsonify({'success': True, 'speed': current_speed})
-    return jsonify({'success': False, 'message': 'Invalid speed value'}), 400
+            return True
+    return False
+
+@app.route('/video_feed')
+def video_feed():
+    """Serve the camera as multipart MJPEG for plain <img> tags and ffmpeg."""
+    if not broadcaster:
+        return jsonify({'success': False, 'message': 'Camera not available'}), 404
+    
+    viewer_id = f"mjpeg-{uuid.uuid4().hex[:8]}"
+    logger.info(f"MJPEG client connected: {request.remote_addr} ({viewer_id})")
+    return Response(broadcaster.mjpeg_stream(viewer_id),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/api/webrtc/offer', methods=['POST'])
+def webrtc_offer():
+    """Exchange an SDP offer for an answer carrying the camera track."""
+    if not webrtc:
+        return jsonify({'success': False, 'message': 'WebRTC not available'}), 404
+    
+    data = request.json
+    if not data or 'sdp' not in data:
+        return jsonify({'success': False, 'message': 'Missing SDP offer'}), 400
+    
+    try:
+        answer = webrtc.handle_offer(data['sdp'], data.get('type', 'offer'))
+        return jsonify({'success': True, 'sdp': answer['sdp'], 'type': answer['type']})
+    except Exception as e:
+        logger.error(f"WebRTC signalling error: {e}")
+        return jsonify({'success': False, 'message': f'WebRTC error: {str(e)}'}), 500
+
+@app.route('/api/stream/stats', methods=['GET'])
+def get_stream_stats():
+    """Get capture pacing and per-viewer video delivery statistics."""
+    if not broadcaster:
+        return jsonify({'success': False, 'message': 'Camera not available'}), 404
+    return jsonify(get_stream_stats_data())
+
+def get_stream_stats_data():
+    return {
+        'success': True,
+        'capture': camera.get_capture_stats(),
+        'viewers': broadcaster.get_stats(),
+        'motion': broadcaster.motion.get_stats(),
+        'webrtc': webrtc.get_stats() if webrtc else {}
+    }
+
+@app.route('/api/stream/latency', methods=['GET'])
+def get_stream_latency():
+    """Get rolling latency histograms per video stage and per viewer."""
+    if not broadcaster:
+        return jsonify({'success': False, 'message': 'Camera not available'}), 404
+    latency = broadcaster.telemetry.get_stats()
+    return jsonify({'success': True, 'stages': latency['stages'], 'viewers': latency['viewers']})
+
+@app.route('/api/blackbox/dump', methods=['POST'])
+def dump_blackbox():
+    """Write the recent video and commands from the black box to disk."""
+    if not recorder:
+        return jsonify({'success': False, 'message': 'Black box recorder not available'}), 404
+    path = recorder.dump('manual', force=True)
+    if not path:
+        return jsonify({'success': False, 'message': 'A dump is already in progress'}), 409
+    return jsonify({'success': True, 'path': path})
 
 @socketio.on('connect')
 def handle_connect():
@@ -201,281 +344,306 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection."""
-    logger.info(f"Client disconnected: {request.sid}")
-    if robot:
-        robot.t_stop(0)  # Stop the robot when client disconnects
+    client_disconnected(request.sid)
+
+def client_disconnected(sid):
+    logger.info(f"Client disconnected: {sid}")
+    if broadcaster:
+        broadcaster.unsubscribe(sid)
+    if motion:
+        motion.stop()  # Stop the robot when client disconnects
+        inputs.remove(sid)
+        control.remove(sid)
+    if recorder:
+        recorder.record_event('disconnect', sid=sid)
+        recorder.dump('disconnect')
+
+# The control handlers below take the client's sid and return the reply as
+# (event, payload), or None, so aio_server.py can share them
 
 @socketio.on('movement')
 def handle_movement(data):
     """Handle movement commands from the joystick."""
-    if not robot:
-        emit('error', {'message': 'Robot controller not available'})
-        return
+    reply = process_movement(data, request.sid)
+    if reply:
+        emit(*reply)
+
+def process_movement(data, sid):
+    if not motion:
+        return 'error', {'message': 'Robot controller not available'}
+    ticket = inputs.receive(sid)
+    
+    if recorder:
+        recorder.record_event('movement', data, sid)
     
     try:
-        direction = data.get('direction')
-        duration = data.get('duration', 0.1)  # Default duration of 0.1 seconds
+        direction = offer_movement(inputs, sid, data, current_speed, ticket)
+        if direction is None:
+            return 'error', {'message': f"Unknown direction: {data.get('direction')}"}
         
-        if direction == 'forward':
-            robot.t_up(current_speed, duration)
-        elif direction == 'backward':
-            robot.t_down(current_speed, duration)
-        elif direction == 'left':
-            robot.turnLeft(current_speed, duration)
-        elif direction == 'right':
-            robot.turnRight(current_speed, duration)
-        elif direction == 'moveLeft':
-            robot.moveLeft(current_speed, duration)
-        elif direction == 'moveRight':
-            robot.moveRight(current_speed, duration)
-        elif direction == 'forwardLeft':
-            robot.forward_Left(current_speed, duration)
-        elif direction == 'forwardRight':
-            robot.forward_Right(current_speed, duration)
-        elif direction == 'backwardLeft':
-            robot.backward_Left(current_speed, duration)
-        elif direction == 'backwardRight':
-            robot.backward_Right(current_speed, duration)
-        elif direction == 'stop':
-            robot.t_stop(duration)
-        else:
-            emit('error', {'message': f'Unknown direction: {direction}'})
-            return
-        
-        emit('movement_status', {'success': True, 'direction': direction})
+        return 'movement_status', {'success': True, 'direction': direction}
     except Exception as e:
         logger.error(f"Movement error: {e}")
-        emit('error', {'message': f'Movement error: {str(e)}'})
+        if recorder:
+            recorder.dump('error')
+        return 'error', {'message': f'Movement error: {str(e)}'}
+
+@socketio.on('control')
+def handle_control(data):
+    """Handle a binary control frame (drive axes, gimbal pose, stop), see control.py."""
+    reply = process_control(data, request.sid)
+    if reply:
+        emit(*reply)
+
+def process_control(data, sid):
+    if not control:
+        return 'error', {'message': 'Robot controller not available'}
+    
+    try:
+        message = control.receive(sid, data)
+    except ValueError as e:
+        return 'error', {'message': f'Invalid control frame: {str(e)}'}
+    except Exception as e:
+        logger.error(f"Control error: {e}")
+        if recorder:
+            recorder.dump('error')
+        return 'error', {'message': f'Control error: {str(e)}'}
+
+    if message is None:
+        return None  # Stale or out of order
+    if recorder:
+        recorder.record_event('control', message._asdict(), sid)
+    if message.flags & FLAG_ACK:
+        return 'control_ack', {'seq': message.seq}
+    return None
+
+@socketio.on('velocity')
+def handle_velocity(data):
+    """Handle analog drive commands: vx, vy and omega from -1 to 1."""
+    reply = process_velocity(data, request.sid)
+    if reply:
+        emit(*reply)
+
+def process_velocity(data, sid):
+    if not motion:
+        return 'error', {'message': 'Robot controller not available'}
+    ticket = inputs.receive(sid)
+    
+    if recorder:
+        recorder.record_event('velocity', data, sid)
+    
+    try:
+        vx, vy, omega = (velocity_axis(data.get(axis, 0)) for axis in ('vx', 'vy', 'omega'))
+        inputs.offer(sid, ('velocity', vx, vy, omega, current_speed, None),
+                     urgent=not (vx or vy or omega), ticket=ticket)
+    except (TypeError, ValueError, AttributeError) as e:
+        return 'error', {'message': f'Invalid velocity command: {str(e)}'}
+    return None
 
 @socketio.on('camera_control')
 def handle_camera_control(data):
     """Handle camera gimbal control commands."""
+    reply = process_camera_control(data, request.sid)
+    if reply:
+        emit(*reply)
+
+def process_camera_control(data, sid):
     if not robot:
-        emit('error', {'message': 'Robot controller not available'})
-        return
+        return 'error', {'message': 'Robot controller not available'}
+    
+    if recorder:
+        recorder.record_event('camera_control', data, sid)
     
     try:
         horizontal = data.get('horizontal', 0)  # -45 to 45 degrees
         vertical = data.get('vertical', 0)      # -10 to 30 degrees
         
-        # Map the values to the servo channels
-        # Assuming channel 12 for horizontal and channel 13 for vertical
-        # Adjust the angle mapping as needed
-        h_angle = 80 + horizontal  # Center is 90 degrees
-        v_angle = 40 + vertical    # Center is 90 degrees
-        
-        # Set servo angles
-        robot.set_servo_angle(9, h_angle)
-        robot.set_servo_angle(10, v_angle)
+        # The gimbal controller slews the servos toward the latest pose
+        gimbal.set_pose(horizontal, vertical)
         
-        emit('camera_status', {'success': True, 'horizontal': horizontal, 'vertical': vertical})
+        return 'camera_status', {'success': True, 'horizontal': horizontal, 'vertical': vertical}
     except Exception as e:
         logger.error(f"Camera control error: {e}")
-        emit('error', {'message': f'Camera control error: {str(e)}'})
+        if recorder:
+            recorder.dump('error')
+        return 'error', {'message': f'Camera control error: {str(e)}'}
 
 @socketio.on('start_stream')
-def handle_start_stream():
-    """Start the video stream."""
-    global is_streaming, streaming_thread
+def handle_start_stream(data=None):
+    """Start the video stream for this client.
+
+    Clients that send {'binary': True} receive raw JPEG bytes on the
+    'video_frame_binary' event; everyone else gets base64 text on
+    'video_frame' as before.
+    """
+    emit(*process_start_stream(data, request.sid))
+
+def process_start_stream(data, sid):
+    if not broadcaster:
+        return 'error', {'message': 'Camera not available'}
     
-    if not camera:
-        emit('error', {'message': 'Camera not available'})
-        return
+    frame_format = 'binary' if data and data.get('binary') else 'base64'
+    already_watching = broadcaster.is_subscribed(sid)
+    viewers = broadcaster.subscribe(sid, frame_format)
     
-    if not is_streaming:
-        is_streaming = True
-        streaming_thread = threading.Thread(target=stream_video)
-        streaming_thread.daemon = True
-        streaming_thread.start()
-        emit('stream_status', {'streaming': True})
-    else:
-        emit('stream_status', {'streaming': True, 'message': 'Stream already running'})
+    status = {'streaming': True, 'format': frame_format, 'viewers': viewers}
+    if already_watching:
+        status['message'] = 'Stream already running'
+    return 'stream_status', status
 
 @socketio.on('stop_stream')
 def handle_stop_stream():
-    """Stop the video stream."""
-    global is_streaming
-    
-    if is_streaming:
-        is_streaming = False
-        emit('stream_status', {'streaming': False})
-    else:
-        emit('stream_status', {'streaming': False, 'message': 'Stream not running'})
-
-def stream_video():
-    """Stream video frames to connected clients."""
-    global is_streaming
-    
-    while is_streaming:
-        if camera:
-            try:
-                frame = camera.get_frame()
-                socketio.emit('video_frame', {'frame': frame})
-                time.sleep(0.03)  # ~30 FPS
-            except Exception as e:
-                logger.error(f"Video streaming error: {e}")
-                socketio.emit('error', {'message': f'Video streaming error: {str(e)}'})
-                is_streaming = False
-                break
+    """Stop the video stream for this client only."""
+    emit(*process_stop_stream(request.sid))
+
+def process_stop_stream(sid):
+    if broadcaster and broadcaster.is_subscribed(sid):
+        viewers = broadcaster.unsubscribe(sid)
+        return 'stream_status', {'streaming': False, 'viewers': viewers}
+    return 'stream_status', {'streaming': False, 'message': 'Stream not running'}
 
 @socketio.on('voice_command')
 def handle_voice_command(data):
     """Process voice commands."""
-    if not voice or not ai_assistant:
-        emit('error', {'message': 'Voice recognition or AI assistant not available'})
-        return
-    
     try:
-        audio_data = data.get('audio')
-        if not audio_data:
-            logger.error("No audio data received in voice command")
-            emit('voice_response', {'success': False, 'message': 'No audio data received'})
-            return
-        
-        logger.info(f"Received voice command audio data of length: {len(audio_data)}")
-        
-        # Process the audio data with voice recognition
-        text = voice.recognize(audio_data)
-        
-        if not text:
-            logger.error("Voice recognition failed to produce text")
-            emit('voice_response', {'success': False, 'message': 'Could not recognize speech. Please try speaking more clearly.'})
-            return
-        
-        logger.info(f"Recognized voice command: {text}")
-        
-        # Process the recognized text with AI assistant
-        response = ai_assistant.process_command(text)
-        
-        # Response should always be a dict now due to our improvements in the AI assistant
-        # But let's add a safety check just in case
-        if not response or not isinstance(response, dict):
-            logger.error(f"AI assistant returned unexpected response type: {type(response)}")
-            emit('voice_response', {'success': False, 'message': 'AI assistant returned an invalid response'})
-            return
-        
-        response_text = response.get('text', '')
-        if not response_text:
-            logger.warning("AI response contained no text")
-            response_text = "I processed your request but didn't generate a proper response."
-            
-        logger.info(f"AI assistant response: {response_text[:100]}...")
-        
-        # Execute command if applicable
-        if 'command' in response:
-            command = response['command']
-            logger.info(f"Executing command from voice: {command}")
-            
-            try:
-                if command and isinstance(command, dict) and 'type' in command:
-                    if command.get('type') == 'movement':
-                        handle_movement({'direction': command.get('direction')})
-                    elif command.get('type') == 'camera':
-                        handle_camera_control({
-                            'horizontal': command.get('horizontal', 0),
-                            'vertical': command.get('vertical', 0)
-                        })
-                else:
-                    logger.warning(f"Invalid command format: {command}")
-            except Exception as cmd_err:
-                logger.error(f"Error executing command: {cmd_err}")
-        
-        # Use text-to-speech to speak the response with current settings
-        if tts and response_text:
-            try:
-                logger.info("Converting response to speech")
-                # Set language based on settings or auto-detect
-                language = tts_settings['language'] if tts_settings['language'] != 'auto' else None
-                tts.speak(
-                    response_text, 
-                    speech_rate=tts_settings['speech_rate'], 
-                    speech_volume=tts_settings['speech_volume'],
-                    language=language
-                )
-            except Exception as tts_err:
-                logger.error(f"Error using text-to-speech: {tts_err}")
-        
-        emit('voice_response', {
-            'success': True,
-            'text': text,
-            'response': response_text,
-            'tts_available': tts is not None
-        })
+        event, payload = process_voice_command(data, request.sid)
+        emit(event, payload)
     except Exception as e:
         logger.error(f"Voice command error: {e}", exc_info=True)
         emit('error', {'message': f'Voice command error: {str(e)}'})
 
+def process_voice_command(data, sid):
+    """Recognize the audio and answer it; returns the (event, payload) to send back."""
+    if not voice or not ai_assistant:
+        return 'error', {'message': 'Voice recognition or AI assistant not available'}
+    
+    audio_data = data.get('audio')
+    if not audio_data:
+        logger.error("No audio data received in voice command")
+        return 'voice_response', {'success': False, 'message': 'No audio data received'}
+    
+    logger.info(f"Received voice command audio data of length: {len(audio_data)}")
+    
+    # Process the audio data with voice recognition
+    text = voice.recognize(audio_data)
+    
+    if not text:
+        logger.error("Voice recognition failed to produce text")
+        return 'voice_response', {'success': False, 'message': 'Could not recognize speech. Please try speaking more clearly.'}
+    
+    logger.info(f"Recognized voice command: {text}")
+    
+    response_text = respond_to_text(text, sid, 'voice')
+    if response_text is None:
+        return 'voice_response', {'success': False, 'message': 'AI assistant returned an invalid response'}
+    
+    return 'voice_response', {
+        'success': True,
+        'text': text,
+        'response': response_text,
+        'tts_available': tts is not None
+    }
+
 @socketio.on('text_command')
 def handle_text_command(data):
     """Process text commands."""
+    try:
+        event, payload = process_text_command(data, request.sid)
+        emit(event, payload)
+    except Exception as e:
+        logger.error(f"Text command error: {e}", exc_info=True)
+        emit('error', {'message': f'Text command error: {str(e)}'})
+
+def process_text_command(data, sid):
+    """Answer a typed command; returns the (event, payload) to send back."""
     if not ai_assistant:
-        emit('error', {'message': 'AI assistant not available'})
-        return
+        return 'error', {'message': 'AI assistant not available'}
     
-    try:
-        text = data.get('text')
-        if not text:
-            emit('text_response', {'success': False, 'message': 'No text received'})
-            return
-            
-        logger.info(f"Processing text command: {text}")
+    text = data.get('text')
+    if not text:
+        return 'text_response', {'success': False, 'message': 'No text received'}
         
-        # Process the text with AI assistant
-        response = ai_assistant.process_command(text)
-        
-        # Response should always be a dict now due to our improvements in the AI assistant
-        # But let's add a safety check just in case
-        if not response or not isinstance(response, dict):
-            logger.error(f"AI assistant returned unexpected response type: {type(response)}")
-            emit('text_response', {'success': False, 'message': 'AI assistant returned an invalid response'})
-            return
-        
-        response_text = response.get('text', '')
-        if not response_text:
-            logger.warning("AI response contained no text")
-            response_text = "I processed your request but didn't generate a proper response."
-        
-        # Execute command if applicable
-        if 'command' in response:
-            command = response['command']
-            logger.info(f"Executing command from text input: {command}")
-            
-            try:
-                if command and isinstance(command, dict) and 'type' in command:
-                    if command.get('type') == 'movement':
-                        handle_movement({'direction': command.get('direction')})
-                    elif command.get('type') == 'camera':
-                        handle_camera_control({
-                            'horizontal': command.get('horizontal', 0),
-                            'vertical': command.get('vertical', 0)
-                        })
-                else:
-                    logger.warning(f"Invalid command format: {command}")
-            except Exception as cmd_err:
-                logger.error(f"Error executing command: {cmd_err}")
+    logger.info(f"Processing text command: {text}")
+    
+    response_text = respond_to_text(text, sid, 'text input')
+    if response_text is None:
+        return 'text_response', {'success': False, 'message': 'AI assistant returned an invalid response'}
+    
+    return 'text_response', {
+        'success': True,
+        'response': response_text,
+        'tts_available': tts is not None
+    }
+
+def respond_to_text(text, sid, source):
+    """
+    Run text through the AI assistant, carry out any command in the answer
+    and speak it. Blocks for as long as the model and speech take.
+    
+    Returns:
+        str: The response text, or None if the assistant's answer was unusable
+    """
+    # Process the text with AI assistant
+    response = ai_assistant.process_command(text)
+    
+    # Response should always be a dict now due to our improvements in the AI assistant
+    # But let's add a safety check just in case
+    if not response or not isinstance(response, dict):
+        logger.error(f"AI assistant returned unexpected response type: {type(response)}")
+        return None
+    
+    response_text = response.get('text', '')
+    if not response_text:
+        logger.warning("AI response contained no text")
+        response_text = "I processed your request but didn't generate a proper response."
         
-        # Use text-to-speech to speak the response with current settings
-        if tts and response_text:
-            try:
-                # Set language based on settings or auto-detect
-                language = tts_settings['language'] if tts_settings['language'] != 'auto' else None
-                tts.speak(
-                    response_text, 
-                    speech_rate=tts_settings['speech_rate'], 
-                    speech_volume=tts_settings['speech_volume'],
-                    language=language
-                )
-            except Exception as tts_err:
-                logger.error(f"Error using text-to-speech: {tts_err}")
+    logger.info(f"AI assistant response: {response_text[:100]}...")
+    
+    # Execute command if applicable
+    if 'command' in response:
+        command = response['command']
+        logger.info(f"Executing command from {source}: {command}")
         
-        emit('text_response', {
-            'success': True,
-            'response': response_text,
-            'tts_available': tts is not None
-        })
-    except Exception as e:
-        logger.error(f"Text command error: {e}", exc_info=True)
-        emit('error', {'message': f'Text command error: {str(e)}'})
+        try:
+            execute_ai_command(sid, command)
+        except Exception as cmd_err:
+            logger.error(f"Error executing command: {cmd_err}")
+    
+    # Use text-to-speech to speak the response with current settings
+    if tts and response_text:
+        try:
+            logger.info("Converting response to speech")
+            # Set language based on settings or auto-detect
+            language = tts_settings['language'] if tts_settings['language'] != 'auto' else None
+            tts.speak(
+                response_text, 
+                speech_rate=tts_settings['speech_rate'], 
+                speech_volume=tts_settings['speech_volume'],
+                language=language
+            )
+        except Exception as tts_err:
+            logger.error(f"Error using text-to-speech: {tts_err}")
+    
+    return response_text
+
+def execute_ai_command(sid, command):
+    """Carry out a movement or camera command extracted by the AI assistant."""
+    if not command or not isinstance(command, dict) or 'type' not in command:
+        logger.warning(f"Invalid command format: {command}")
+        return
+    
+    if recorder:
+        recorder.record_event('ai_command', command, sid)
+    
+    if command.get('type') == 'movement' and motion:
+        direction = command.get('direction')
+        if direction not in DIRECTIONS:
+            logger.warning(f"Unknown direction from AI assistant: {direction}")
+            return
+        inputs.offer(sid, ('movement', direction, current_speed, Config.MOTION_VOICE_DURATION),
+                     urgent=direction == 'stop')
+    elif command.get('type') == 'camera' and gimbal:
+        gimbal.set_pose(command.get('horizontal', 0), command.get('vertical', 0))
 
 # Add a new endpoint to toggle text-to-speech
 @socketio.on('toggle_tts')
@@ -527,9 +695,16 @@ def handle_get_tts_settings():
 @socketio.on('test_tts')
 def handle_test_tts(data):
     """Test text-to-speech with the given settings."""
+    try:
+        emit(*process_tts_test(data))
+    except Exception as e:
+        logger.error(f"Error testing text-to-speech: {e}")
+        emit('error', {'message': f'Text-to-speech test error: {str(e)}'})
+
+def process_tts_test(data):
+    """Speak a test message with the given settings; returns the (event, payload) to send back."""
     if not tts:
-        emit('error', {'message': 'Text-to-speech not available'})
-        return
+        return 'error', {'message': 'Text-to-speech not available'}
     
     # Get settings from request or use current settings
     speech_rate = data.get('speech_rate', tts_settings['speech_rate'])
@@ -545,39 +720,53 @@ def handle_test_tts(data):
     if language not in ['auto', 'en', 'zh']:
         language = 'auto'
     
-    try:
-        # Choose appropriate test message based on language
-        if custom_text:
-            test_message = custom_text
-        elif language == 'zh':
-            test_message = "这是一个中文语音合成测试，当前使用的是设定好的语音参数。"
-        elif language == 'en':
-            test_message = "This is a test of the text-to-speech system with the current settings."
-        else:
-            # Auto-detect - use both languages to demonstrate
-            test_message = "This is a bilingual test. 这是一个双语测试。"
-        
-        # Convert language setting for TTS function
-        tts_language = None if language == 'auto' else language
-        
-        # Speak the test message
-        tts.speak(
-            test_message, 
-            is_announcement=True, 
-            speech_rate=speech_rate, 
-            speech_volume=speech_volume,
-            language=tts_language
-        )
-        
-        emit('tts_test', {
-            'success': True,
-            'message': 'Text-to-speech test started',
-            'text': test_message,
-            'language': language
-        })
-    except Exception as e:
-        logger.error(f"Error testing text-to-speech: {e}")
-        emit('error', {'message': f'Text-to-speech test error: {str(e)}'})
+    # Choose appropriate test message based on language
+    if custom_text:
+        test_message = custom_text
+    elif language == 'zh':
+        test_message = "这是一个中文语音合成测试，当前使用的是设定好的语音参数。"
+    elif language == 'en':
+        test_message = "This is a test of the text-to-speech system with the current settings."
+    else:
+        # Auto-detect - use both languages to demonstrate
+        test_message = "This is a bilingual test. 这是一个双语测试。"
+    
+    # Convert language setting for TTS function
+    tts_language = None if language == 'auto' else language
+    
+    # Speak the test message
+    tts.speak(
+        test_message, 
+        is_announcement=True, 
+        speech_rate=speech_rate, 
+        speech_volume=speech_volume,
+        language=tts_language
+    )
+    
+    return 'tts_test', {
+        'success': True,
+        'message': 'Text-to-speech test started',
+        'text': test_message,
+        'language': language
+    }
+
+def shutdown():
+    """Stop the robot and release every subsystem, in both server modes."""
+    logger.info("Server shutting down...")
+    if motion:
+        motion.close()  # Stop the robot
+    if gimbal:
+        gimbal.close()
+    if bus:
+        bus.close()  # Finish queued bus writes
+    if webrtc:
+        webrtc.close()  # Close peer connections
+    if recorder_feed:
+        recorder_feed.close()
+    if camera:
+        camera.release()  # Release camera resources
+    if recorder:
+        recorder.close()  # Mark the black box as cleanly shut down
 
 if __name__ == '__main__':
     try:
@@ -599,8 +788,4 @@ if __name__ == '__main__':
         socketio.run(app, host='0.0.0.0', port=5000, debug=False, 
                     allow_unsafe_werkzeug=True, ssl_context=ssl_context)
     except KeyboardInterrupt:
-        logger.info("Server shutting down...")
-        if robot:
-            robot.t_stop(0)  # Stop the robot
-        if camera:
-            camera.release()  # Release camera resources 
\ No newline at end of file
+        shutdown()
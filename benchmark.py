@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor-control micro-benchmarks against the simulated I2C/GPIO backend.
+
+Measures the latency distribution and I2C transactions of the LOBOROBOT
+operations and of the movement input path the Socket.IO handlers use,
+plus sustained commands per second through it. Runs anywhere: the hardware is the
+transaction-recording simulation from hardware.py, with its modelled bus
+timing unless --no-latency is given.
+
+    python benchmark.py --output bench_results.json
+
+Results are written as JSON so runs of different versions can be diffed.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds."""
+    samples = sorted(samples)
+    n = len(samples)
+    if not n:
+        return {'samples': 0}
+    return {
+        'samples': n,
+        'mean': round(sum(samples) / n, 4),
+        'p50': round(samples[int(n * 0.5)], 4),
+        'p90': round(samples[int(n * 0.9)], 4),
+        'p99': round(samples[min(n - 1, int(n * 0.99))], 4),
+        'max': round(samples[-1], 4)
+    }
+
+
+def bench_operation(log, name, op, iterations, setup=None):
+    """Time op(i) and count the bus transactions it issues."""
+    samples = []
+    transactions = gpio_writes = size = 0
+    for i in range(iterations):
+        if setup:
+            setup(i)
+        before = log.get_stats()
+        started = time.perf_counter()
+        op(i)
+        samples.append((time.perf_counter() - started) * 1000)
+        after = log.get_stats()
+        transactions += after['transactions'] - before['transactions']
+        gpio_writes += after['gpio_writes'] - before['gpio_writes']
+        size += after['bytes'] - before['bytes']
+    return {
+        'name': name,
+        'iterations': iterations,
+        'latency_ms': summarize(samples),
+        'transactions_per_call': round(transactions / iterations, 3),
+        'gpio_writes_per_call': round(gpio_writes / iterations, 3),
+        'bytes_per_call': round(size / iterations, 3)
+    }
+
+
+def bench_robot(iterations):
+    """Benchmark the LOBOROBOT operations one by one."""
+    from LOBOROBOT import LOBOROBOT
+    from hardware import create_backend
+
+    robot = LOBOROBOT(create_backend())
+    log = robot.backend.log
+
+    def alternate(i, a, b):
+        return a if i % 2 else b
+
+    operations = (
+        ('t_up', lambda i: robot.t_up(alternate(i, 50, 60), 0), None),
+        ('t_up (unchanged)', lambda i: robot.t_up(50, 0), lambda i: robot.t_up(50, 0)),
+        ('turnLeft', lambda i: robot.turnLeft(alternate(i, 50, 60), 0), None),
+        ('t_stop', lambda i: robot.t_stop(0), lambda i: robot.t_up(50, 0)),
+        ('MotorRun', lambda i: robot.MotorRun(0, 'forward', alternate(i, 50, 60)), None),
+        ('MotorRun (motor D reversal)',
+         lambda i: robot.MotorRun(3, alternate(i, 'forward', 'backward'), 50), None),
+        ('set_wheels', lambda i: robot.set_wheels([alternate(i, 50, 60), -50, 30, -30]), None),
+        ('set_servo_angle', lambda i: robot.set_servo_angle(9, alternate(i, 80, 90)), None),
+        ('set_servo_angles',
+         lambda i: robot.set_servo_angles({9: alternate(i, 80, 90), 10: alternate(i, 40, 50)}),
+         None),
+        ('resync', lambda i: robot.resync(), None)
+    )
+    results = []
+    for name, op, setup in operations:
+        results.append(bench_operation(log, name, op, iterations, setup))
+    robot.t_stop(0)
+    return results
+
+
+def wait_for_bus(log, since, timeout=1.0):
+    """Seconds from since until the first bus transaction after it, or None."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        first = min((t for t, kind, *_ in log.transactions()
+                     if t >= since and kind != 'gpio'), default=None)
+        if first is not None:
+            return first - since
+        time.sleep(0.0005)
+    return None
+
+
+def bench_control(iterations, duration):
+    """
+    Benchmark the movement and camera input path.
+
+    Builds the same BusWorker, MotionController, GimbalController and
+    InputCoalescer stack as app.py and feeds it through the movement
+    handler's own offer_movement(), without the web server or any of the
+    other subsystems.
+    """
+    from LOBOROBOT import LOBOROBOT
+    from hardware import create_backend
+    from bus_worker import BusWorker
+    from drive import MotionController, InputCoalescer, offer_movement
+    from gimbal import GimbalController
+
+    robot = LOBOROBOT(create_backend())
+    log = robot.backend.log
+    bus = BusWorker()
+    motion = MotionController(robot, bus=bus)
+    gimbal = GimbalController(robot, bus=bus)
+
+    inputs = InputCoalescer(motion.apply)
+    speed = 50
+
+    def movement(direction):
+        offer_movement(inputs, 'bench', {'direction': direction}, speed, inputs.receive('bench'))
+
+    results = {}
+    for name, op in (('movement', lambda i: movement('forward' if i % 2 else 'left')),
+                     ('camera_control', lambda i: gimbal.set_pose(i % 45, i % 30))):
+        samples = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            op(i)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[f'{name}_handler_ms'] = summarize(samples)
+
+    # Command to first bus transaction: the handler plus the wait for the
+    # next control tick and the bus worker. The random part of the pause
+    # spreads the commands over the phase of the control loop.
+    samples = []
+    for i in range(min(iterations, 50)):
+        movement('stop')
+        time.sleep(0.1 + random.uniform(0, motion.tick))
+        since = time.monotonic()
+        movement('forward')
+        latency = wait_for_bus(log, since)
+        if latency is not None:
+            samples.append(latency * 1000)
+    results['movement_to_bus_ms'] = summarize(samples)
+
+    # Sustained throughput with the joystick's alternating directions
+    movement('stop')
+    time.sleep(0.2)
+    before_log = log.get_stats()
+    before_motion = motion.get_stats()
+    commands = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        movement('forward' if commands % 2 else 'right')
+        commands += 1
+    elapsed = time.perf_counter() - started
+    after_log = log.get_stats()
+    after_motion = motion.get_stats()
+    results['sustained'] = {
+        'commands': commands,
+        'seconds': round(elapsed, 3),
+        'commands_per_second': round(commands / elapsed, 1),
+        'superseded': after_motion['superseded'] - before_motion['superseded'],
+        'wheel_writes': after_motion['writes'] - before_motion['writes'],
+        'transactions': after_log['transactions'] - before_log['transactions']
+    }
+
+    movement('stop')
+    gimbal.close()
+    motion.close()
+    bus.close()
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motor-control micro-benchmarks")
+    parser.add_argument('--iterations', type=int, default=200, help="Calls per operation")
+    parser.add_argument('--duration', type=float, default=2.0,
+                        help="Seconds of sustained movement commands")
+    parser.add_argument('--output', default='bench_results.json', help="JSON results file")
+    parser.add_argument('--no-latency', action='store_true',
+                        help="Zero simulated bus time to measure software overhead only")
+    parser.add_argument('--skip-control', action='store_true',
+                        help="Only benchmark the LOBOROBOT operations")
+    args = parser.parse_args()
+
+    # Config reads the environment on import, so set it up first
+    os.environ['HARDWARE_BACKEND'] = 'sim'
+    if args.no_latency:
+        os.environ['SIM_I2C_LATENCY_US'] = '0'
+        os.environ['SIM_I2C_BYTE_US'] = '0'
+        os.environ['SIM_GPIO_LATENCY_US'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from config import Config
+
+    results = {
+        'version': git_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'bus': {
+            'latency_us': Config.SIM_I2C_LATENCY_US,
+            'byte_us': Config.SIM_I2C_BYTE_US,
+            'gpio_latency_us': Config.SIM_GPIO_LATENCY_US
+        },
+        'operations': bench_robot(args.iterations)
+    }
+    if not args.skip_control:
+        results['control'] = bench_control(args.iterations, args.duration)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'operation':<30} {'p50 ms':>9} {'p99 ms':>9} {'i2c/call':>9} {'gpio/call':>9}")
+    for op in results['operations']:
+        print(f"{op['name']:<30} {op['latency_ms']['p50']:>9.3f} {op['latency_ms']['p99']:>9.3f} "
+              f"{op['transactions_per_call']:>9.2f} {op['gpio_writes_per_call']:>9.2f}")
+    if 'control' in results:
+        print(json.dumps(results['control'], indent=2))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
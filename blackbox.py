@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import tempfile
+from threading import Lock, Thread
+from collections import deque
+from config import Config
+from pacing import FramePacer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ring file header: magic, version, write cursor, next sequence number
+FILE_HEADER = struct.Struct('<8sIxxxxQQ')
+FILE_MAGIC = b'GCBLACKB'
+FILE_VERSION = 1
+
+# Record header: magic, type, sequence number, wall-clock time, payload length
+RECORD_HEADER = struct.Struct('<4sBxxxQdI')
+RECORD_MAGIC = b'GCBR'
+RECORD_FRAME = 1
+RECORD_EVENT = 2
+
+# Minimum seconds between two automatic dumps (errors can come in bursts)
+DUMP_COOLDOWN = 5.0
+
+
+def default_ring_path():
+    """Keep the ring in RAM-backed storage when available to spare the SD card."""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'gcnew-blackbox.bin')
+
+
+class BlackBoxRecorder:
+    """
+    Flight-recorder style ring buffer of recent video frames and commands.
+
+    Encoded JPEG frames and control events are appended to a fixed-size ring
+    inside a memory-mapped file, so recording costs one copy into the map
+    per frame and never touches the filesystem. Old records are overwritten
+    as the ring wraps. dump() writes the last BLACKBOX_SECONDS to
+    BLACKBOX_DUMP_DIR as an MJPEG file plus a JSON-lines index of every
+    frame and event.
+
+    The ring lives in /dev/shm by default, so it survives a crash of the
+    server process; a ring left behind by a previous run is dumped on
+    startup.
+    """
+
+    def __init__(self, config=None):
+        """Initialize the recorder and map its ring file."""
+        self.config = config or Config()
+        self.lock = Lock()
+        self.path = self.config.BLACKBOX_PATH or default_ring_path()
+        self.size = int(self.config.BLACKBOX_SIZE_MB * 1024 * 1024)
+        self.data_start = FILE_HEADER.size
+        self.last_dump_time = 0.0
+        self.is_dumping = False
+        self.recorded = 0
+        self.overwritten = 0
+
+        recovered = self._open()
+        if recovered:
+            self._write_dump('recovered', recovered)
+        self._reset()
+        logger.info(f"Black box recorder ready ({self.config.BLACKBOX_SIZE_MB} MB ring at {self.path})")
+
+    def _open(self):
+        """Map a fresh ring file, returning any valid records a previous run left."""
+        recovered = []
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size == self.size:
+                self.mm = mmap.mmap(fd, self.size)
+                magic, version, _, seq = FILE_HEADER.unpack_from(self.mm, 0)
+                # Sequence 0 means a fresh ring or a clean shutdown
+                if magic == FILE_MAGIC and version == FILE_VERSION and seq:
+                    recovered = self._scan(0.0)
+                self.mm.close()
+
+            # Truncating zeroes the old contents so stale records from this
+            # run can never be mistaken for new ones after another crash
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, self.size)
+            self.mm = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        return recovered
+
+    def _reset(self):
+        self.cursor = self.data_start
+        self.seq = 1
+        self.index = deque()  # (seq, offset, length) of live records, oldest first
+        FILE_HEADER.pack_into(self.mm, 0, FILE_MAGIC, FILE_VERSION, self.cursor, 0)
+
+    def record_frame(self, jpeg, captured_at=None):
+        """Append an encoded JPEG frame (bytes or memoryview)."""
+        self._append(RECORD_FRAME, jpeg, captured_at or time.time())
+
+    def record_event(self, event, data=None, sid=None):
+        """Append a control event such as 'movement' or 'camera_control'."""
+        payload = json.dumps({'event': event, 'data': data, 'sid': sid},
+                             default=str).encode('utf-8')
+        self._append(RECORD_EVENT, payload, time.time())
+
+    def _append(self, record_type, payload, timestamp):
+        length = len(payload)
+        needed = RECORD_HEADER.size + length
+        if needed > self.size - self.data_start:
+            return
+
+        with self.lock:
+            if self.cursor + needed > self.size:
+                # Not enough room before the end: give up the tail and wrap
+                self._evict(self.cursor, self.size)
+                self.cursor = self.data_start
+            start = self.cursor
+            self._evict(start, start + needed)
+
+            RECORD_HEADER.pack_into(self.mm, start, RECORD_MAGIC, record_type,
+                                    self.seq, timestamp, length)
+            self.mm[start + RECORD_HEADER.size:start + needed] = payload
+            self.index.append((self.seq, start, needed))
+            self.seq += 1
+            self.cursor = start + needed
+            FILE_HEADER.pack_into(self.mm, 0, FILE_MAGIC, FILE_VERSION, self.cursor, self.seq)
+            self.recorded += 1
+
+    def _evict(self, start, end):
+        """Forget records that the write about to happen will overwrite."""
+        while self.index:
+            _, offset, length = self.index[0]
+            if offset >= end or offset + length <= start:
+                break
+            self.index.popleft()
+            self.overwritten += 1
+
+    def _read_record(self, offset):
+        """Parse the record at offset, or return None if there is none."""
+        if offset + RECORD_HEADER.size > self.size:
+            return None
+        magic, record_type, seq, timestamp, length = RECORD_HEADER.unpack_from(self.mm, offset)
+        if magic != RECORD_MAGIC or offset + RECORD_HEADER.size + length > self.size:
+            return None
+        start = offset + RECORD_HEADER.size
+        return seq, record_type, timestamp, bytes(self.mm[start:start + length])
+
+    def _scan(self, since):
+        """
+        Walk the ring file and return valid records newer than since.
+
+        Used for crash recovery, where no in-memory index exists. The oldest
+        surviving data follows the write cursor; records there are found by
+        searching for the next record header.
+        """
+        records = []
+        offset = self.mm.find(RECORD_MAGIC, self.data_start)
+        while offset != -1:
+            record = self._read_record(offset)
+            if record is None:
+                offset = self.mm.find(RECORD_MAGIC, offset + 1)
+                continue
+            if record[2] >= since:
+                records.append(record)
+            offset = self.mm.find(RECORD_MAGIC, offset + RECORD_HEADER.size + len(record[3]))
+        records.sort(key=lambda r: r[0])
+        return records
+
+    def _snapshot(self, since):
+        """Copy out the live records newer than since, oldest first."""
+        with self.lock:
+            records = []
+            for _, offset, _ in self.index:
+                record = self._read_record(offset)
+                if record is not None and record[2] >= since:
+                    records.append(record)
+            return records
+
+    def dump(self, reason='manual', force=False):
+        """
+        Write the last BLACKBOX_SECONDS of frames and events to disk.
+
+        The records are copied out of the ring under the lock and written
+        from a background thread, so callers in the control path never
+        wait on the SD card.
+
+        Args:
+            reason (str): Label for the dump, e.g. 'manual', 'error', 'disconnect'
+            force (bool): Ignore the cooldown between automatic dumps
+
+        Returns:
+            str: Base path of the dump files, or None if it was skipped
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.is_dumping or (not force and now - self.last_dump_time < DUMP_COOLDOWN):
+                return None
+            self.is_dumping = True
+            self.last_dump_time = now
+
+        records = self._snapshot(time.time() - self.config.BLACKBOX_SECONDS)
+        base = self._dump_path(reason)
+        thread = Thread(target=self._write_dump, args=(reason, records, base),
+                        name="blackbox-dump")
+        thread.daemon = True
+        thread.start()
+        return base
+
+    def _dump_path(self, reason):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.config.BLACKBOX_DUMP_DIR, f"{stamp}-{reason}")
+
+    def _write_dump(self, reason, records, base=None):
+        base = base or self._dump_path(reason)
+        try:
+            os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+            frames = 0
+            with open(base + '.mjpeg', 'wb') as video, open(base + '.jsonl', 'w') as index:
+                for seq, record_type, timestamp, payload in records:
+                    entry = {'seq': seq, 'time': timestamp}
+                    if record_type == RECORD_FRAME:
+                        entry.update({'type': 'frame', 'offset': video.tell(), 'size': len(payload)})
+                        video.write(payload)
+                        frames += 1
+                    else:
+                        entry['type'] = 'event'
+                        entry.update(json.loads(payload.decode('utf-8')))
+                    index.write(json.dumps(entry) + '\n')
+            logger.info(f"Black box dump ({reason}): {frames} frames, "
+                        f"{len(records) - frames} events -> {base}")
+        except Exception as e:
+            logger.error(f"Error writing black box dump: {e}")
+        finally:
+            with self.lock:
+                self.is_dumping = False
+
+    def get_stats(self):
+        """Return ring usage counters."""
+        with self.lock:
+            return {
+                'path': self.path,
+                'size': self.size,
+                'records': len(self.index),
+                'recorded': self.recorded,
+                'overwritten': self.overwritten
+            }
+
+    def close(self):
+        """Unmap the ring file after a clean shutdown."""
+        with self.lock:
+            # Sequence 0 tells the next start there is nothing to recover
+            FILE_HEADER.pack_into(self.mm, 0, FILE_MAGIC, FILE_VERSION, self.cursor, 0)
+            self.mm.flush()
+            self.mm.close()
+
+
+class BlackBoxFeed:
+    """
+    Always-on camera consumer that keeps the black box supplied with video.
+
+    It holds its own camera subscription, so the recorder sees frames even
+    when nobody is watching or every viewer uses WebRTC, and it records at
+    a fixed BLACKBOX_FPS and BLACKBOX_QUALITY regardless of the motion gate
+    and of what the adaptive viewers ask for. Encodes are shared with any
+    viewer that wants the same settings.
+    """
+
+    def __init__(self, camera, recorder, config=None):
+        """Start recording frames from the camera."""
+        self.config = config or Config()
+        self.camera = camera
+        self.recorder = recorder
+        self.pacer = FramePacer(self.config.BLACKBOX_FPS)
+        # Accept a frame up to half a capture interval early, as viewers do
+        self.tolerance = 0.5 / max(1, self.config.CAMERA_FRAMERATE)
+        self.is_running = True
+        self.camera.start()
+        self.thread = Thread(target=self._run, name="blackbox-feed")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Black box video feed started ({self.config.BLACKBOX_FPS} fps, "
+                    f"quality {self.config.BLACKBOX_QUALITY})")
+
+    def _run(self):
+        last_frame_id = 0
+        while self.is_running:
+            try:
+                frame_id, raw = self.camera.wait_for_frame(last_frame_id)
+                if raw is None:
+                    continue
+                last_frame_id = frame_id
+                try:
+                    if not self.pacer.is_due(time.monotonic(), self.tolerance):
+                        continue
+                    jpeg = self.camera.encode(frame_id, raw, self.config.BLACKBOX_QUALITY,
+                                              self.config.BLACKBOX_SCALE)
+                finally:
+                    self.camera.release_frame(raw)
+                if jpeg is not None:
+                    self.recorder.record_frame(memoryview(jpeg).cast('B'),
+                                               self.camera.capture_time(frame_id))
+            except Exception as e:
+                logger.error(f"Black box video feed error: {e}")
+                time.sleep(0.1)
+
+    def close(self):
+        """Stop recording and release the camera subscription."""
+        self.is_running = False
+        self.thread.join(timeout=2.0)
+        self.camera.stop()
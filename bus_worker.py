@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import heapq
+import logging
+import itertools
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Request priorities, most urgent first
+PRIORITY_STOP = 0
+PRIORITY_MOTOR = 1
+PRIORITY_SERVO = 2
+PRIORITY_BACKGROUND = 3  # Logging, register read-back
+PRIORITY_NAMES = {
+    PRIORITY_STOP: 'stop',
+    PRIORITY_MOTOR: 'motor',
+    PRIORITY_SERVO: 'servo',
+    PRIORITY_BACKGROUND: 'background'
+}
+
+
+class BusRequest:
+    """A queued bus operation and everyone waiting for its result."""
+
+    def __init__(self, priority, key, fn, args):
+        self.priority = priority
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.futures = []
+        self.queued = True
+        self.submitted = time.monotonic()
+
+
+class BusWorker:
+    """
+    Single owner of the I2C bus.
+
+    Motor, servo and read-back operations from any thread are queued here
+    and run one at a time on the worker thread, so multi-register sequences
+    can never interleave. The queue is ordered by priority (stop, motor,
+    servo, background) and then by arrival, so a stop waits at most for the
+    one transaction already on the wire, never behind gimbal traffic.
+
+    Requests submitted with a key coalesce: while one is still queued, a
+    newer request with the same key replaces its operation (latest wins)
+    and takes the more urgent of the two priorities.
+    """
+
+    def __init__(self, name="i2c-bus"):
+        """Initialize the queue and start the worker thread."""
+        self.condition = Condition()
+        self.queue = []  # Heap of (priority, order, request)
+        self.pending = {}  # key -> queued BusRequest
+        self.order = itertools.count()
+        self.is_running = True
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.executed = 0
+        self.errors = 0
+        self.max_wait_ms = {name: 0.0 for name in PRIORITY_NAMES.values()}
+
+        self.thread = Thread(target=self._run, name=name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, priority, key, fn, *args):
+        """
+        Queue fn(*args) to run on the bus thread.
+
+        Args:
+            priority (int): One of the PRIORITY_* constants
+            key: Coalescing key such as ('servo', 9), or None to never coalesce
+            fn (callable): The bus operation
+
+        Returns:
+            Future: Resolves to fn's result or exception
+        """
+        future = Future()
+        with self.condition:
+            if not self.is_running:
+                future.set_exception(RuntimeError("I2C bus worker is closed"))
+                return future
+
+            self.submitted += 1
+            request = self.pending.get(key) if key is not None else None
+            if request is not None:
+                self.coalesced += 1
+                request.fn = fn
+                request.args = args
+                if priority < request.priority:
+                    # The old heap entry is skipped once this one has run
+                    request.priority = priority
+                    heapq.heappush(self.queue, (priority, next(self.order), request))
+            else:
+                request = BusRequest(priority, key, fn, args)
+                if key is not None:
+                    self.pending[key] = request
+                heapq.heappush(self.queue, (priority, next(self.order), request))
+            request.futures.append(future)
+            self.condition.notify()
+        return future
+
+    def call(self, priority, key, fn, *args, timeout=None):
+        """Submit fn(*args) and wait for its result."""
+        return self.submit(priority, key, fn, *args).result(timeout)
+
+    def _next(self):
+        """Pop the most urgent live request, or None once closed and drained."""
+        with self.condition:
+            while True:
+                while self.queue:
+                    _, _, request = heapq.heappop(self.queue)
+                    if not request.queued:
+                        continue  # Superseded entry of a re-prioritized request
+                    request.queued = False
+                    if request.key is not None and self.pending.get(request.key) is request:
+                        del self.pending[request.key]
+                    return request
+                if not self.is_running:
+                    return None
+                self.condition.wait()
+
+    def _run(self):
+        while True:
+            request = self._next()
+            if request is None:
+                break
+
+            name = PRIORITY_NAMES.get(request.priority, 'background')
+            wait_ms = (time.monotonic() - request.submitted) * 1000
+            self.max_wait_ms[name] = max(self.max_wait_ms[name], wait_ms)
+            try:
+                result = request.fn(*request.args)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"I2C bus {name} request failed: {e}")
+                for future in request.futures:
+                    future.set_exception(e)
+            else:
+                for future in request.futures:
+                    future.set_result(result)
+            self.executed += 1
+
+    def get_stats(self):
+        """Return queue depth and request counters."""
+        with self.condition:
+            return {
+                'queued': len(self.pending) + sum(1 for _, _, r in self.queue
+                                                  if r.queued and r.key is None),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'executed': self.executed,
+                'errors': self.errors,
+                'max_wait_ms': {name: round(ms, 2) for name, ms in self.max_wait_ms.items()}
+            }
+
+    def close(self):
+        """Run what is still queued, then end the worker thread."""
+        with self.condition:
+            self.is_running = False
+            self.condition.notify()
+        self.thread.join(timeout=2.0)
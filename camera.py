@@ -2,123 +2,589 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import json
 import time
 import logging
 import base64
 import numpy as np
 import cv2
 from config import Config
-from threading import Lock
+from frame_source import create_frame_source
+from pacing import FramePacer
+from threading import Lock, Condition, Thread
+from collections import OrderedDict
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, 
+logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class FramePool:
+    """
+    A fixed set of preallocated frame buffers reused by the capture thread.
+
+    Buffers are handed out round-robin, skipping the one currently published
+    as the latest frame and any buffer a reader has put a hold on, so a frame
+    is never overwritten while a reader still uses it.
+    """
+
+    def __init__(self, size, shape, dtype=np.uint8):
+        self.lock = Lock()
+        self.shape = shape
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self.holds = [0] * size
+        self.index_of = {id(buffer): i for i, buffer in enumerate(self.buffers)}
+        self.next_index = 0
+
+    def acquire(self, exclude=None):
+        """Return a free buffer other than exclude, or None if all are busy."""
+        with self.lock:
+            for _ in range(len(self.buffers)):
+                i = self.next_index
+                self.next_index = (self.next_index + 1) % len(self.buffers)
+                if self.holds[i] == 0 and self.buffers[i] is not exclude:
+                    return self.buffers[i]
+            return None
+
+    def owns(self, buffer):
+        return id(buffer) in self.index_of
+
+    def hold(self, buffer):
+        """Protect a buffer from reuse until release() is called."""
+        with self.lock:
+            i = self.index_of.get(id(buffer))
+            if i is not None:
+                self.holds[i] += 1
+
+    def release(self, buffer):
+        with self.lock:
+            i = self.index_of.get(id(buffer))
+            if i is not None:
+                self.holds[i] = max(0, self.holds[i] - 1)
+
+
 class Camera:
-    """Camera class for handling video streaming."""
-    
+    """Camera class for handling video streaming.
+
+    A background capture thread continuously drains the device and keeps only
+    the newest frame. Consumers read that frame through the encoder stage
+    (get_frame) without ever waiting on cv2.VideoCapture.read() themselves.
+
+    Capture is reference counted: every consumer calls start() when it needs
+    frames and stop() when it is done, and the capture thread only runs while
+    at least one consumer is active.
+
+    With CAMERA_MJPEG_PASSTHROUGH the device is asked for MJPG and the
+    compressed buffers are published as-is (1-D uint8 arrays). They are
+    forwarded to viewers untouched and only decoded when a consumer actually
+    needs pixels (see wait_for_image). The timestamp is then sent as frame
+    metadata instead of being drawn into the picture.
+
+    Frames are captured into a FramePool and the overlay/resize stages write
+    into reusable buffers, so a steady-state frame allocates nothing large
+    besides the encoded JPEG itself. wait_for_frame() puts a hold on the
+    buffer it returns; it stays valid until the caller hands it back with
+    release_frame().
+    """
+
     def __init__(self):
         """Initialize the camera with configuration settings."""
         self.config = Config()
         self.lock = Lock()
         self.camera = None
         self.is_running = False
-        
+
+        # Latest-frame buffer shared between the capture and encoder stages
+        self.frame_condition = Condition()
+        self.latest_frame = None
+        self.latest_frame_id = 0
+        self.latest_frame_time = 0.0
+        self.capture_times = OrderedDict()  # frame_id -> (wall-clock, monotonic) capture time
+        self.capture_thread = None
+        self.is_capturing = False
+        self.consumers = 0
+        # Only used for accounting: measures the rate the source really delivers
+        self.capture_pacer = FramePacer(self.config.CAMERA_FRAMERATE)
+
+        # Encoder stage cache: encodes of the last frame are reused by every
+        # caller until the capture thread publishes a newer one
+        self.encode_lock = Lock()
+        self.encoded_frame_id = 0
+        self.encoded_frames = {}
+        self.annotated_frame = None
+        self.annotate_buffer = None
+        self.resize_buffers = {}  # scale -> reusable resize output
+
+        # Preallocated capture buffers, created lazily from the first frame's shape
+        self.frame_pool = None
+
+        # Decoded pixels of the latest compressed frame (passthrough mode)
+        self.passthrough = self.config.CAMERA_MJPEG_PASSTHROUGH
+        self.decode_lock = Lock()
+        self.decoded_frame_id = 0
+        self.decoded_frame = None
+
         # Try to initialize the camera
         try:
-            # Use OpenCV for non-Raspberry Pi systems
-            self.camera = cv2.VideoCapture(0)
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.config.CAMERA_WIDTH)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.config.CAMERA_HEIGHT)
-            self.camera.set(cv2.CAP_PROP_FPS, self.config.CAMERA_FRAMERATE)
-                
-            if not self.camera.isOpened():
+            # The frame source is chosen by Config.CAMERA_SOURCE, so the same
+            # pipeline can run against a real camera, a test pattern or a replay
+            self.camera = create_frame_source(self.config)
+
+            if not self.camera.is_opened():
                 raise Exception("Could not open camera")
-                
-            logger.info("OpenCV camera initialized successfully")
+
+            logger.info(f"Camera initialized successfully ({type(self.camera).__name__})")
             self.is_raspberry_pi = False
-            
+
             self.is_running = True
         except Exception as e:
             logger.error(f"Failed to initialize camera: {e}")
             self.is_running = False
             raise
-    
-    
-    def get_frame(self):
-        """Get a frame from the camera and encode it as base64."""
-        if not self.is_running:
-            return None
-        
+
+    def start(self):
+        """Register a consumer, starting the capture thread for the first one."""
         with self.lock:
+            self.consumers += 1
+            if not self.is_running or self.is_capturing:
+                return
+            self.is_capturing = True
+            self.capture_thread = Thread(target=self._capture_loop, name="camera-capture")
+            self.capture_thread.daemon = True
+            self.capture_thread.start()
+
+    def stop(self):
+        """Unregister a consumer, pausing capture when the last one leaves.
+
+        The device stays open so capture can resume quickly.
+        """
+        with self.lock:
+            self.consumers = max(0, self.consumers - 1)
+            if self.consumers or not self.is_capturing:
+                return
+            self.is_capturing = False
+            if self.capture_thread and self.capture_thread.is_alive():
+                self.capture_thread.join(timeout=2.0)
+
+    def _capture_loop(self):
+        """Continuously read frames and publish only the newest one."""
+        logger.info("Camera capture thread started")
+        while self.is_running and self.is_capturing:
+            buffer = None
+            if self.frame_pool is not None and not self.passthrough:
+                buffer = self.frame_pool.acquire(exclude=self.latest_frame)
             try:
-             
-                # Get frame from OpenCV
-                ret, frame = self.camera.read()
-                if not ret:
-                    logger.error("Failed to capture frame from camera")
-                    return None
-                
-                # Add timestamp to the frame
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                cv2.putText(frame, timestamp, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                            0.8, (0, 255, 255), 2, cv2.LINE_AA)
-                
-                # Encode the frame as JPEG
-                _, buffer = cv2.imencode('.jpg', frame)
-                
-                # Convert to base64 for sending over WebSocket
-                jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-                
-                return jpg_as_text
+                ret, frame = self.camera.read(buffer)
             except Exception as e:
                 logger.error(f"Error capturing frame: {e}")
+                ret, frame = False, None
+
+            if not ret:
+                logger.error("Failed to capture frame from camera")
+                # Avoid spinning on a dead device
+                time.sleep(0.1)
+                continue
+
+            if self.passthrough and frame.ndim != 1:
+                # The backend decoded anyway, so there is nothing to pass through
+                logger.warning("Camera backend does not expose raw MJPEG, disabling passthrough")
+                self.passthrough = False
+
+            if not self.passthrough and (self.frame_pool is None or
+                                         self.frame_pool.shape != frame.shape):
+                # Size the pool from what the source actually delivers
+                logger.info(f"Allocating {self.config.CAMERA_BUFFER_POOL} frame buffers of {frame.shape}")
+                self.frame_pool = FramePool(self.config.CAMERA_BUFFER_POOL, frame.shape, frame.dtype)
+
+            with self.frame_condition:
+                self.latest_frame = frame
+                self.latest_frame_id += 1
+                self.latest_frame_time = time.monotonic()
+                self.capture_pacer.tick(self.latest_frame_time)
+                self.capture_times[self.latest_frame_id] = (time.time(), self.latest_frame_time)
+                while len(self.capture_times) > 16:
+                    self.capture_times.popitem(last=False)
+                self.frame_condition.notify_all()
+        logger.info("Camera capture thread stopped")
+
+    def wait_for_frame(self, last_frame_id=0, timeout=1.0):
+        """
+        Wait for a frame newer than last_frame_id.
+
+        The capture thread will not reuse the returned buffer until the
+        caller passes it to release_frame(), which it must always do.
+
+        Args:
+            last_frame_id (int): Id of the last frame the caller has seen
+            timeout (float): Maximum time to wait in seconds
+
+        Returns:
+            tuple: (frame_id, frame) or (last_frame_id, None) on timeout
+        """
+        with self.frame_condition:
+            self.frame_condition.wait_for(
+                lambda: not self.is_running or self.latest_frame_id > last_frame_id,
+                timeout=timeout
+            )
+            if self.latest_frame_id <= last_frame_id or self.latest_frame is None:
+                return last_frame_id, None
+            # Still the latest frame, so the capture thread cannot be
+            # writing into it; the hold keeps it that way
+            if self.frame_pool is not None:
+                self.frame_pool.hold(self.latest_frame)
+            return self.latest_frame_id, self.latest_frame
+
+    def release_frame(self, frame):
+        """Hand back a frame from wait_for_frame() so its buffer can be reused."""
+        pool = self.frame_pool
+        if pool is not None and frame is not None:
+            pool.release(frame)
+
+    def capture_time(self, frame_id):
+        """Wall-clock time (seconds since the epoch) a recent frame was captured."""
+        return self.capture_timestamps(frame_id)[0]
+
+    def capture_timestamps(self, frame_id):
+        """
+        Capture time of a recent frame on both clocks.
+
+        Returns:
+            tuple: (wall-clock, monotonic) seconds, or (None, None) if unknown
+        """
+        with self.frame_condition:
+            return self.capture_times.get(frame_id, (None, None))
+
+    def get_capture_stats(self):
+        """Return the target and achieved capture frame rate and jitter."""
+        with self.frame_condition:
+            return self.capture_pacer.get_stats()
+
+    def is_annotated(self):
+        """Whether encoded frames carry the timestamp drawn into the picture."""
+        return not self.passthrough
+
+    def decode(self, frame_id, frame):
+        """
+        Return BGR pixels for a frame from wait_for_frame().
+
+        Compressed passthrough frames are decoded at most once per frame id;
+        frames that are already pixels are returned unchanged.
+        """
+        if frame is None or frame.ndim != 1:
+            return frame
+        with self.decode_lock:
+            if frame_id != self.decoded_frame_id:
+                self.decoded_frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+                self.decoded_frame_id = frame_id
+            return self.decoded_frame
+
+    def wait_for_image(self, last_frame_id=0, timeout=1.0):
+        """
+        Like wait_for_frame(), but always returns BGR pixels.
+
+        Use this for consumers such as vision processing or WebRTC that need
+        the picture itself rather than the encoded stream. The image belongs
+        to the caller and needs no release_frame().
+        """
+        frame_id, frame = self.wait_for_frame(last_frame_id, timeout)
+        try:
+            image = self.decode(frame_id, frame)
+            if image is frame and frame is not None:
+                # Pixels still live in a pool buffer; keep a private copy
+                image = frame.copy()
+            return frame_id, image
+        finally:
+            self.release_frame(frame)
+
+    def encode(self, frame_id, frame, quality=None, scale=1.0):
+        """
+        Encode a captured frame as JPEG.
+
+        Results are cached per (quality, scale) for the current frame id, so
+        every consumer asking for the same settings shares a single encode.
+
+        Args:
+            frame_id (int): Id of the frame as returned by wait_for_frame()
+            frame (numpy.ndarray): Frame as returned by wait_for_frame() and
+                not yet released, BGR pixels or a compressed MJPEG buffer in
+                passthrough mode
+            quality (int): JPEG quality 1-100, None for the OpenCV default
+            scale (float): Output scale relative to the captured resolution
+
+        Returns:
+            numpy.ndarray: Encoded JPEG buffer, or None on failure
+        """
+        with self.encode_lock:
+            return self._encode_locked(frame_id, frame, quality, scale)
+
+    def _encode_locked(self, frame_id, frame, quality, scale):
+        """Encode with encode_lock held; reuses the overlay and resize buffers."""
+        key = (quality, scale)
+        if frame_id != self.encoded_frame_id:
+            self.encoded_frame_id = frame_id
+            self.encoded_frames = {}
+            self.annotated_frame = None
+        elif key in self.encoded_frames:
+            return self.encoded_frames[key]
+
+        if frame.ndim == 1:
+            if self._is_full_quality(quality, scale):
+                # Forward the camera's own JPEG without touching it
+                self.encoded_frames[key] = frame
+                return frame
+            # A degraded setting was requested, so we need pixels after all
+            frame = self.decode(frame_id, frame)
+            if frame is None:
+                logger.error("Failed to decode camera MJPEG frame")
                 return None
-    
+
+        if not self.is_annotated():
+            self.annotated_frame = frame
+        elif self.annotated_frame is None:
+            # Other readers share the captured frame, so draw the overlay
+            # on a private, reused copy
+            if self.annotate_buffer is None or self.annotate_buffer.shape != frame.shape:
+                self.annotate_buffer = np.empty_like(frame)
+            annotated = self.annotate_buffer
+            np.copyto(annotated, frame)
+
+            # Add timestamp to the frame
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            cv2.putText(annotated, timestamp, (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8, (0, 255, 255), 2, cv2.LINE_AA)
+            self.annotated_frame = annotated
+
+        output = self.annotated_frame
+        if scale < 1.0:
+            height, width = output.shape[:2]
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            resized = self.resize_buffers.get(scale)
+            if resized is not None and resized.shape[:2] != (size[1], size[0]):
+                resized = None
+            output = cv2.resize(output, size, dst=resized, interpolation=cv2.INTER_AREA)
+            self.resize_buffers[scale] = output
+
+        # Encode the frame as JPEG
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)] if quality else []
+        ok, buffer = cv2.imencode('.jpg', output, params)
+        if not ok:
+            logger.error("Failed to encode frame")
+            return None
+
+        self.encoded_frames[key] = buffer
+        return buffer
+
+    def _is_full_quality(self, quality, scale):
+        """Whether (quality, scale) asks for nothing below the stream ceiling."""
+        return scale >= 1.0 and (quality is None or quality >= self.config.STREAM_QUALITY_MAX)
+
+    def _encode_latest(self, last_frame_id=None, timeout=1.0):
+        """
+        Encode the newest captured frame as JPEG at default settings.
+
+        Args:
+            last_frame_id (int): Wait for a frame newer than this id. None
+                waits for a frame newer than the last encoded one; 0 returns
+                the cached frame immediately if there is one.
+            timeout (float): Maximum time to wait in seconds
+
+        Returns:
+            tuple: (frame_id, buffer), buffer is None if nothing is available
+        """
+        if not self.is_running:
+            return last_frame_id or 0, None
+
+        since = self.encoded_frame_id if last_frame_id is None else last_frame_id
+        frame_id, frame = self.wait_for_frame(since, timeout)
+        if frame is None:
+            if last_frame_id is None:
+                with self.encode_lock:
+                    return self.encoded_frame_id, self.encoded_frames.get((None, 1.0))
+            return since, None
+        try:
+            return frame_id, self.encode(frame_id, frame)
+        finally:
+            self.release_frame(frame)
+
+    def read_jpeg(self, last_frame_id=0, timeout=1.0):
+        """
+        Wait for a frame newer than last_frame_id and return it as JPEG.
+
+        Unlike get_jpeg(), this never hands back a frame the caller has
+        already seen, which lets independent consumers track their own
+        position in the stream.
+
+        Returns:
+            tuple: (frame_id, bytes) or (last_frame_id, None) on timeout
+        """
+        try:
+            frame_id, buffer = self._encode_latest(last_frame_id, timeout)
+            if buffer is None:
+                return last_frame_id, None
+            return frame_id, buffer.tobytes()
+        except Exception as e:
+            logger.error(f"Error capturing frame: {e}")
+            return last_frame_id, None
+
+    def get_jpeg(self, wait=True, timeout=1.0):
+        """
+        Get the latest frame as raw JPEG bytes.
+
+        This is the preferred path for binary transports: it skips the base64
+        step entirely and the bytes can be sent as a Socket.IO attachment.
+
+        Args:
+            wait (bool): Block until a frame newer than the last encoded one
+                is available.
+            timeout (float): Maximum time to wait for a new frame in seconds
+
+        Returns:
+            bytes: JPEG data, or None if no frame is available
+        """
+        try:
+            _, buffer = self._encode_latest(None if wait else 0, timeout)
+            if buffer is None:
+                return None
+            return buffer.tobytes()
+        except Exception as e:
+            logger.error(f"Error capturing frame: {e}")
+            return None
+
+    def get_frame(self, wait=True, timeout=1.0):
+        """
+        Get the latest frame encoded as base64.
+
+        Kept as a fallback for clients that cannot handle binary frames;
+        see get_jpeg() for the binary path.
+
+        Args:
+            wait (bool): Block until a frame newer than the last encoded one
+                is available. This paces callers at the capture frame rate.
+            timeout (float): Maximum time to wait for a new frame in seconds
+
+        Returns:
+            str: Base64 encoded JPEG, or None if no frame is available
+        """
+        try:
+            _, buffer = self._encode_latest(None if wait else 0, timeout)
+            if buffer is None:
+                return None
+
+            # Convert to base64 for sending over WebSocket
+            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
+
+            return jpg_as_text
+        except Exception as e:
+            logger.error(f"Error capturing frame: {e}")
+            return None
+
     def release(self):
         """Release camera resources."""
         with self.lock:
             if self.is_running:
                 try:
-                   
-                    self.camera.release()
-                    
                     self.is_running = False
+                    self.is_capturing = False
+                    with self.frame_condition:
+                        self.frame_condition.notify_all()
+                    if self.capture_thread and self.capture_thread.is_alive():
+                        self.capture_thread.join(timeout=2.0)
+
+                    self.camera.release()
+
                     logger.info("Camera resources released")
                 except Exception as e:
                     logger.error(f"Error releasing camera resources: {e}")
 
+def benchmark(camera, duration=10.0, quality=None, scale=1.0):
+    """
+    Measure capture and encode throughput without a display.
+
+    Combine with CAMERA_SOURCE=synthetic or replay to get comparable numbers
+    on machines without a camera attached.
+
+    Returns:
+        dict: Achieved frame rate and encode time statistics
+    """
+    camera.start()
+    camera.capture_pacer.reset()
+    try:
+        encode_times = []
+        sizes = []
+        last_frame_id = 0
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            frame_id, frame = camera.wait_for_frame(last_frame_id)
+            if frame is None:
+                continue
+            last_frame_id = frame_id
+            encode_start = time.perf_counter()
+            try:
+                buffer = camera.encode(frame_id, frame, quality, scale)
+            finally:
+                camera.release_frame(frame)
+            encode_times.append(time.perf_counter() - encode_start)
+            if buffer is not None:
+                sizes.append(len(buffer))
+        elapsed = time.monotonic() - start
+    finally:
+        camera.stop()
+
+    encode_times.sort()
+    count = len(encode_times)
+    capture = camera.get_capture_stats()
+    return {
+        'source': type(camera.camera).__name__,
+        'frames': count,
+        'fps': count / elapsed if elapsed else 0.0,
+        'capture_fps': capture['fps'],
+        'capture_jitter_ms': capture['jitter_ms'],
+        'encode_ms_mean': 1000 * sum(encode_times) / count if count else 0.0,
+        'encode_ms_p95': 1000 * encode_times[int(count * 0.95)] if count else 0.0,
+        'jpeg_kb_mean': sum(sizes) / len(sizes) / 1024 if sizes else 0.0
+    }
+
 # For testing the camera module directly
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        # Headless throughput test: python camera.py --benchmark [seconds]
+        duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+        camera = Camera()
+        try:
+            print(json.dumps(benchmark(camera, duration), indent=2))
+        finally:
+            camera.release()
+        sys.exit(0)
+
     try:
         camera = Camera()
+        camera.start()
         print("Camera initialized. Press Ctrl+C to exit.")
-        
+
         # Display frames for testing
-        
+
         while True:
+            # get_frame blocks until a new frame arrives, so no sleep is needed
             frame_base64 = camera.get_frame()
             if frame_base64:
                 # Decode base64 to display with OpenCV
                 jpg_original = base64.b64decode(frame_base64)
                 jpg_as_np = np.frombuffer(jpg_original, dtype=np.uint8)
                 frame = cv2.imdecode(jpg_as_np, flags=1)
-                    
+
                 # Display the frame
                 cv2.imshow('Camera Test', frame)
-                    
+
                 # Break the loop on 'q' key press
                 if cv2.waitKey(1) & 0xFF == ord('q'):
                     break
-                
-                time.sleep(0.03)  # ~30 FPS
-            
+
     except KeyboardInterrupt:
         print("Exiting...")
     finally:
         if 'camera' in locals():
             camera.release()
-        
+
         if not camera.is_raspberry_pi and cv2.getWindowProperty('Camera Test', cv2.WND_PROP_VISIBLE) >= 0:
-            cv2.destroyAllWindows() 
\ No newline at end of file
+            cv2.destroyAllWindows()
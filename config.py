@@ -20,19 +20,75 @@ class Config:
     
     # Camera settings
     CAMERA_ENABLED = os.environ.get('CAMERA_ENABLED', 'True').lower() in ('true', '1', 't')
+    CAMERA_SOURCE = os.environ.get('CAMERA_SOURCE', 'opencv')  # 'opencv', 'synthetic' or 'replay'
+    CAMERA_DEVICE = os.environ.get('CAMERA_DEVICE', '0')  # Device index or path for 'opencv'
+    CAMERA_REPLAY_PATH = os.environ.get('CAMERA_REPLAY_PATH', '')  # Video file, image directory or glob
+    CAMERA_REPLAY_LOOP = os.environ.get('CAMERA_REPLAY_LOOP', 'True').lower() in ('true', '1', 't')
+    CAMERA_SYNTHETIC_PATTERN = os.environ.get('CAMERA_SYNTHETIC_PATTERN', 'bars')  # 'bars' or 'noise'
+    CAMERA_BUFFER_POOL = int(os.environ.get('CAMERA_BUFFER_POOL', 4))  # Preallocated capture buffers
     CAMERA_WIDTH = int(os.environ.get('CAMERA_WIDTH', 640))
     CAMERA_HEIGHT = int(os.environ.get('CAMERA_HEIGHT', 480))
     CAMERA_FRAMERATE = int(os.environ.get('CAMERA_FRAMERATE', 30))
+    # Forward the USB camera's own MJPEG frames instead of decoding and re-encoding
+    CAMERA_MJPEG_PASSTHROUGH = os.environ.get('CAMERA_MJPEG_PASSTHROUGH', 'False').lower() in ('true', '1', 't')
+    
+    # Adaptive video stream settings (per-viewer floors and ceilings)
+    STREAM_ADAPTIVE = os.environ.get('STREAM_ADAPTIVE', 'True').lower() in ('true', '1', 't')
+    STREAM_QUALITY_MIN = int(os.environ.get('STREAM_QUALITY_MIN', 35))
+    STREAM_QUALITY_MAX = int(os.environ.get('STREAM_QUALITY_MAX', 85))
+    STREAM_SCALE_MIN = float(os.environ.get('STREAM_SCALE_MIN', 0.5))
+    STREAM_SCALE_MAX = float(os.environ.get('STREAM_SCALE_MAX', 1.0))
+    STREAM_FPS_MIN = int(os.environ.get('STREAM_FPS_MIN', 5))
+    STREAM_FPS_MAX = int(os.environ.get('STREAM_FPS_MAX', CAMERA_FRAMERATE))
+    STREAM_LATENCY_TARGET_MS = int(os.environ.get('STREAM_LATENCY_TARGET_MS', 150))
+    
+    # Motion gating: stop sending frames while the scene is static
+    STREAM_MOTION_GATE = os.environ.get('STREAM_MOTION_GATE', 'True').lower() in ('true', '1', 't')
+    STREAM_MOTION_THRESHOLD = float(os.environ.get('STREAM_MOTION_THRESHOLD', 0.01))  # Fraction of pixels changed
+    STREAM_MOTION_PIXEL_DELTA = int(os.environ.get('STREAM_MOTION_PIXEL_DELTA', 12))  # Gray levels that count as a change
+    STREAM_IDLE_REFRESH = float(os.environ.get('STREAM_IDLE_REFRESH', 1.0))  # Seconds between frames of a static scene
+    
+    # Black box recorder: keeps the last seconds of video and commands in RAM
+    BLACKBOX_ENABLED = os.environ.get('BLACKBOX_ENABLED', 'True').lower() in ('true', '1', 't')
+    BLACKBOX_SECONDS = float(os.environ.get('BLACKBOX_SECONDS', 30))
+    BLACKBOX_SIZE_MB = int(os.environ.get('BLACKBOX_SIZE_MB', 32))
+    BLACKBOX_PATH = os.environ.get('BLACKBOX_PATH', '')  # Ring file; defaults to /dev/shm
+    BLACKBOX_DUMP_DIR = os.environ.get('BLACKBOX_DUMP_DIR', 'blackbox')
+    BLACKBOX_FPS = int(os.environ.get('BLACKBOX_FPS', 10))  # Recorded frames per second, viewers or not
+    BLACKBOX_QUALITY = int(os.environ.get('BLACKBOX_QUALITY', 70))
+    BLACKBOX_SCALE = float(os.environ.get('BLACKBOX_SCALE', 1.0))
     
     # Robot settings
     ROBOT_ENABLED = os.environ.get('ROBOT_ENABLED', 'True').lower() in ('true', '1', 't')
     DEFAULT_SPEED = int(os.environ.get('DEFAULT_SPEED', 50))
+    MOTION_CONTROL_RATE = int(os.environ.get('MOTION_CONTROL_RATE', 50))  # Control ticks per second
+    MOTION_DEADMAN_TIMEOUT = float(os.environ.get('MOTION_DEADMAN_TIMEOUT', 0.5))  # Stop without fresh commands
+    MOTION_ACCEL = float(os.environ.get('MOTION_ACCEL', 400))  # Duty %/s when speeding up, 0 = instant
+    MOTION_DECEL = float(os.environ.get('MOTION_DECEL', 800))  # Duty %/s when slowing down, 0 = instant
+    MOTION_JERK = float(os.environ.get('MOTION_JERK', 8000))  # Duty %/s² change in acceleration, 0 = unlimited
+    MOTION_VOICE_DURATION = float(os.environ.get('MOTION_VOICE_DURATION', 1.0))  # How long a voice command drives
+    MOTION_MAX_HOLD = float(os.environ.get('MOTION_MAX_HOLD', 3.0))  # Longest a setpoint may outlive its command
+    
+    # Asyncio server mode (aio_server.py)
+    SERVER_ML_WORKERS = int(os.environ.get('SERVER_ML_WORKERS', 1))  # Speech recognition, AI model, TTS
+    SERVER_IO_WORKERS = int(os.environ.get('SERVER_IO_WORKERS', 8))  # Stream start/stop, WebRTC signalling
+    SERVER_SESSION_WORKERS = int(os.environ.get('SERVER_SESSION_WORKERS', 2))  # Disconnects, MJPEG (un)subscribe
+    
+    # Hardware backend: 'pi' (smbus2/gpiozero) or 'sim' (simulated PCA9685 bus and GPIO)
+    HARDWARE_BACKEND = os.environ.get('HARDWARE_BACKEND', 'pi')
+    SIM_I2C_LATENCY_US = float(os.environ.get('SIM_I2C_LATENCY_US', 50))  # Fixed cost per transaction
+    SIM_I2C_BYTE_US = float(os.environ.get('SIM_I2C_BYTE_US', 90))  # Per byte; 90us is 9 bits at 100 kHz
+    SIM_I2C_ERROR_RATE = float(os.environ.get('SIM_I2C_ERROR_RATE', 0.0))  # Fraction of transactions that fail
+    SIM_GPIO_LATENCY_US = float(os.environ.get('SIM_GPIO_LATENCY_US', 0))
+    SIM_LOG_SIZE = int(os.environ.get('SIM_LOG_SIZE', 10000))  # Transactions kept in the log
     
     # Servo settings
-    HORIZONTAL_SERVO_CHANNEL = int(os.environ.get('HORIZONTAL_SERVO_CHANNEL', 12))
-    VERTICAL_SERVO_CHANNEL = int(os.environ.get('VERTICAL_SERVO_CHANNEL', 13))
-    HORIZONTAL_SERVO_DEFAULT = int(os.environ.get('HORIZONTAL_SERVO_DEFAULT', 90))  # Center position
-    VERTICAL_SERVO_DEFAULT = int(os.environ.get('VERTICAL_SERVO_DEFAULT', 90))      # Center position
+    HORIZONTAL_SERVO_CHANNEL = int(os.environ.get('HORIZONTAL_SERVO_CHANNEL', 9))
+    VERTICAL_SERVO_CHANNEL = int(os.environ.get('VERTICAL_SERVO_CHANNEL', 10))
+    HORIZONTAL_SERVO_DEFAULT = int(os.environ.get('HORIZONTAL_SERVO_DEFAULT', 80))  # Center position
+    VERTICAL_SERVO_DEFAULT = int(os.environ.get('VERTICAL_SERVO_DEFAULT', 40))      # Center position
+    GIMBAL_CONTROL_RATE = int(os.environ.get('GIMBAL_CONTROL_RATE', 50))  # Slew ticks per second
+    GIMBAL_MAX_RATE = float(os.environ.get('GIMBAL_MAX_RATE', 180))  # Degrees per second, 0 = jump
     
     # Voice recognition settings
     VOICE_ENABLED = os.environ.get('VOICE_ENABLED', 'True').lower() in ('true', '1', 't')
@@ -46,6 +102,7 @@ class Config:
     # WebRTC settings
     WEBRTC_ENABLED = os.environ.get('WEBRTC_ENABLED', 'True').lower() in ('true', '1', 't')
     STUN_SERVER = os.environ.get('STUN_SERVER', 'stun:stun.l.google.com:19302')
+    WEBRTC_CODEC = os.environ.get('WEBRTC_CODEC', 'VP8')  # 'VP8' or 'H264'
     
     # Static file settings
     STATIC_FOLDER = 'static'
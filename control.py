@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import struct
+from collections import namedtuple
+from threading import Lock
+from telemetry import LatencyHistogram
+
+# Binary control frame, little endian:
+#   version, flags, sequence number, client timestamp (ms, wrapping),
+#   vx, vy, omega (quantized to -127..127), pan, tilt (degrees from center)
+CONTROL_FRAME = struct.Struct('<BBIIbbbbb')
+CONTROL_VERSION = 1
+AXIS_SCALE = 127
+
+# Frame flags; a frame may carry several
+FLAG_STOP = 0x01
+FLAG_DRIVE = 0x02
+FLAG_GIMBAL = 0x04
+FLAG_ACK = 0x80  # Client asks for a control_ack carrying the sequence number
+
+# Handlers run in this order, so a stop always comes first
+DISPATCH_ORDER = (FLAG_STOP, FLAG_DRIVE, FLAG_GIMBAL)
+
+SEQ_MODULO = 1 << 32
+
+ControlMessage = namedtuple('ControlMessage',
+                            'flags seq timestamp vx vy omega pan tilt')
+
+
+def encode(seq, timestamp, flags, vx=0.0, vy=0.0, omega=0.0, pan=0, tilt=0):
+    """Pack a control frame; the counterpart of sendControlFrame in joystick.js."""
+    axes = (max(-AXIS_SCALE, min(AXIS_SCALE, int(round(v * AXIS_SCALE)))) for v in (vx, vy, omega))
+    return CONTROL_FRAME.pack(CONTROL_VERSION, flags, seq % SEQ_MODULO,
+                              int(timestamp) % SEQ_MODULO, *axes, int(pan), int(tilt))
+
+
+def decode(payload):
+    """
+    Unpack a control frame.
+
+    Raises:
+        ValueError: If the payload has the wrong size or version
+    """
+    if not isinstance(payload, (bytes, bytearray, memoryview)) or len(payload) != CONTROL_FRAME.size:
+        raise ValueError(f"Control frame must be {CONTROL_FRAME.size} bytes")
+    version, flags, seq, timestamp, vx, vy, omega, pan, tilt = CONTROL_FRAME.unpack(payload)
+    if version != CONTROL_VERSION:
+        raise ValueError(f"Unsupported control protocol version: {version}")
+    return ControlMessage(flags, seq, timestamp, vx / AXIS_SCALE, vy / AXIS_SCALE,
+                          omega / AXIS_SCALE, pan, tilt)
+
+
+def is_newer(seq, last):
+    """Serial number comparison that survives the 32-bit sequence wrapping."""
+    return 0 < (seq - last) % SEQ_MODULO < SEQ_MODULO // 2
+
+
+class ControlReceiver:
+    """
+    Decodes control frames and dispatches them through a handler table.
+
+    Each client's frames must arrive with increasing sequence numbers;
+    duplicates and frames older than one already accepted are dropped. A
+    client's frames are checked and dispatched one at a time under its own
+    lock, so with handlers on several threads a late stale input can still
+    never override a newer one. Handlers must not block. The client timestamps
+    give the jitter of the control link: how much the spacing of arrivals
+    differs from the spacing the frames were sent with.
+    """
+
+    def __init__(self, handlers):
+        """
+        Args:
+            handlers (dict): Maps a FLAG_* value to fn(sid, message)
+        """
+        self.handlers = handlers
+        self.lock = Lock()
+        self.clients = {}  # sid -> (last sequence number, client timestamp, arrival time)
+        self.client_locks = {}  # sid -> Lock held while checking and dispatching
+        self.jitter = LatencyHistogram()
+        self.accepted = 0
+        self.stale = 0
+        self.malformed = 0
+
+    def receive(self, sid, payload):
+        """
+        Decode and dispatch one frame.
+
+        Returns:
+            ControlMessage: The dispatched message, or None if it was stale
+
+        Raises:
+            ValueError: If the frame is malformed
+        """
+        try:
+            message = decode(payload)
+        except ValueError:
+            with self.lock:
+                self.malformed += 1
+            raise
+
+        arrived = time.monotonic()
+        with self.lock:
+            client_lock = self.client_locks.setdefault(sid, Lock())
+
+        with client_lock:
+            with self.lock:
+                last = self.clients.get(sid)
+                if last is not None and not is_newer(message.seq, last[0]):
+                    self.stale += 1
+                    return None
+                if last is not None and message.seq == (last[0] + 1) % SEQ_MODULO:
+                    sent_ms = (message.timestamp - last[1]) % SEQ_MODULO
+                    self.jitter.record(abs((arrived - last[2]) * 1000 - sent_ms))
+                self.clients[sid] = (message.seq, message.timestamp, arrived)
+                self.accepted += 1
+
+            for flag in DISPATCH_ORDER:
+                if message.flags & flag and flag in self.handlers:
+                    self.handlers[flag](sid, message)
+        return message
+
+    def remove(self, sid):
+        """Forget a client that disconnected."""
+        with self.lock:
+            self.clients.pop(sid, None)
+            self.client_locks.pop(sid, None)
+
+    def get_stats(self):
+        """Return frame counters and the control link jitter."""
+        with self.lock:
+            return {
+                'accepted': self.accepted,
+                'stale': self.stale,
+                'malformed': self.malformed,
+                'jitter_ms': self.jitter.get_stats()
+            }
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import math
+import logging
+from threading import Condition, Lock, Thread
+from config import Config
+from pacing import FramePacer
+from bus_worker import PRIORITY_MOTOR, PRIORITY_STOP
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Movement directions as (vx, vy, omega) body velocities. Mixed like any
+# other velocity they give the same wheel directions as the LOBOROBOT
+# methods of the same name (t_up, moveLeft, backward_Left, ...).
+DIRECTIONS = {
+    'forward': (1, 0, 0),
+    'backward': (-1, 0, 0),
+    'left': (0, 0, 1),
+    'right': (0, 0, -1),
+    'moveLeft': (0, 1, 0),
+    'moveRight': (0, -1, 0),
+    'forwardLeft': (1, 1, 0),
+    'forwardRight': (1, -1, 0),
+    'backwardLeft': (-1, 1, 0),
+    'backwardRight': (-1, -1, 0),
+    'stop': (0, 0, 0)
+}
+
+STOP = ('direction', 'stop', 0)
+WHEELS = 4
+
+
+def velocity_axis(value):
+    """
+    Validate one velocity component and clamp it to [-1, 1].
+
+    Raises:
+        ValueError: If the value is not a finite number
+    """
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"Velocity must be finite, got {value}")
+    return max(-1.0, min(1.0, value))
+
+
+class MotionController:
+    """
+    Single owner of the drive motors.
+
+    Callers post setpoints with command() (one of the discrete DIRECTIONS)
+    or velocity() (continuous mecanum control); both return immediately.
+    Setpoints that arrive between two control ticks replace each other, so
+    a burst of joystick events costs nothing extra. If no fresh setpoint
+    arrives within MOTION_DEADMAN_TIMEOUT the motors are stopped, so a lost
+    connection or a hung client cannot leave the robot driving.
+
+    The control loop runs at MOTION_CONTROL_RATE against monotonic
+    deadlines. Each tick every wheel moves toward its target duty cycle
+    under the MOTION_ACCEL / MOTION_DECEL limits, with the change in
+    acceleration bounded by MOTION_JERK, and the wheels are only written
+    when a rounded duty cycle actually changed. With a BusWorker the
+    writes are queued on the bus thread instead of blocking the loop, and a
+    write that brings every wheel to zero goes out at stop priority. An
+    error inside the loop stops the motors and the loop carries on.
+    """
+
+    def __init__(self, robot, config=None, bus=None):
+        """Initialize the controller and start its thread."""
+        self.config = config or Config()
+        self.robot = robot
+        self.bus = bus
+        self.tick = 1.0 / self.config.MOTION_CONTROL_RATE
+        self.pacer = FramePacer(self.config.MOTION_CONTROL_RATE)
+        self.condition = Condition()
+        self.pending = None  # Latest (setpoint, hold) not yet picked up
+        self.setpoint = STOP
+        self.expires = 0.0
+        self.is_running = True
+
+        # Ramp state per wheel, in signed duty cycle percent
+        self.targets = [0.0] * WHEELS
+        self.duties = [0.0] * WHEELS
+        self.accels = [0.0] * WHEELS
+        self.written = None  # Last rounded duties sent to the robot
+
+        self.commands = 0
+        self.superseded = 0
+        self.deadman_stops = 0
+        self.writes = 0
+        self.overruns = 0
+        self.errors = 0
+        self.max_loop_ms = 0.0
+
+        self.thread = Thread(target=self._run, name="motion-controller")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Motion controller started ({self.config.MOTION_CONTROL_RATE} Hz, "
+                    f"deadman {self.config.MOTION_DEADMAN_TIMEOUT}s)")
+
+    def command(self, direction, speed, hold=None):
+        """
+        Post a new setpoint without waiting for the motors.
+
+        Args:
+            direction (str): One of DIRECTIONS
+            speed (int): Speed 0-100
+            hold (float): Seconds the setpoint stays valid without being
+                repeated; never shorter than the deadman timeout and never
+                longer than MOTION_MAX_HOLD
+
+        Returns:
+            bool: False if the direction is unknown
+
+        Raises:
+            ValueError: If hold is not a finite number
+        """
+        if direction not in DIRECTIONS:
+            return False
+        self._post(STOP if direction == 'stop' else ('direction', direction, speed), hold)
+        return True
+
+    def velocity(self, vx, vy, omega, speed, hold=None):
+        """
+        Post a continuous velocity setpoint without waiting for the motors.
+
+        Args:
+            vx, vy, omega (float): Forward, leftward and counter-clockwise
+                velocity, each from -1 to 1
+            speed (int): Duty cycle 0-100 of the fastest wheel
+            hold (float): As for command()
+
+        Raises:
+            ValueError: If a component or hold is not a finite number;
+                components outside -1 to 1 are clamped
+        """
+        self._post(('velocity', velocity_axis(vx), velocity_axis(vy), velocity_axis(omega), speed),
+                   hold)
+
+    def stop(self):
+        """Ramp the motors down to a stop."""
+        self._post(STOP, None)
+
+    def apply(self, intent):
+        """Post a ('movement', direction, speed, hold) or ('velocity', vx, vy, omega, speed, hold) intent."""
+        if intent[0] == 'velocity':
+            self.velocity(*intent[1:])
+        else:
+            self.command(*intent[1:])
+
+    def _post(self, setpoint, hold):
+        hold = float(hold) if isinstance(hold, (int, float)) else 0.0
+        if not math.isfinite(hold):
+            raise ValueError(f"Hold must be finite, got {hold}")
+        # A hold that outlasts the deadman must not disable it for good
+        hold = min(hold, self.config.MOTION_MAX_HOLD)
+        with self.condition:
+            if self.pending is not None:
+                self.superseded += 1
+            self.pending = (setpoint, hold)
+            self.commands += 1
+
+    def _wheel_targets(self, setpoint):
+        if setpoint[0] == 'velocity':
+            vx, vy, omega, speed = setpoint[1:]
+        else:
+            (vx, vy, omega), speed = DIRECTIONS[setpoint[1]], setpoint[2]
+        return self.robot.mix_velocity(vx, vy, omega, speed)
+
+    def _run(self):
+        while self.is_running:
+            try:
+                self._tick()
+            except Exception as e:
+                # Keep the loop (and with it the deadman) alive no matter what
+                logger.error(f"Motion control error, stopping motors: {e}", exc_info=True)
+                self.errors += 1
+                self._emergency_stop()
+                time.sleep(self.tick)
+
+    def _tick(self):
+        self.pacer.wait()
+        started = time.monotonic()
+
+        with self.condition:
+            pending = self.pending
+            self.pending = None
+
+        if pending is not None:
+            self.setpoint, hold = pending
+            self.expires = started + max(hold, self.config.MOTION_DEADMAN_TIMEOUT)
+            self.targets = self._wheel_targets(self.setpoint)
+        elif self.setpoint != STOP and started > self.expires:
+            logger.warning("No movement command within the deadman timeout, stopping")
+            self.deadman_stops += 1
+            self.setpoint = STOP
+            self.targets = [0.0] * WHEELS
+
+        self._step()
+        self._write()
+
+        elapsed = time.monotonic() - started
+        self.max_loop_ms = max(self.max_loop_ms, elapsed * 1000)
+        if elapsed > self.tick:
+            self.overruns += 1
+
+    def _step(self):
+        """Advance every wheel one control tick toward its target."""
+        dt = self.tick
+        jerk = self.config.MOTION_JERK * dt
+        for i in range(WHEELS):
+            target, duty = self.targets[i], self.duties[i]
+            error = target - duty
+            if not error:
+                self.accels[i] = 0.0
+                continue
+
+            # Speeding up is limited by MOTION_ACCEL, slowing down (including
+            # through zero on a reversal) by MOTION_DECEL
+            speeding_up = abs(target) > abs(duty) and target * duty >= 0
+            limit = self.config.MOTION_ACCEL if speeding_up else self.config.MOTION_DECEL
+            if limit <= 0:
+                self.duties[i] = target
+                self.accels[i] = 0.0
+                continue
+
+            accel = max(-limit, min(limit, error / dt))
+            if jerk > 0:
+                previous = self.accels[i]
+                accel = previous + max(-jerk, min(jerk, accel - previous))
+            self.accels[i] = accel
+
+            step = accel * dt
+            if step * error <= 0:
+                # Acceleration is still swinging round; never move away
+                continue
+            if abs(step) >= abs(error):
+                self.duties[i] = target
+                self.accels[i] = 0.0
+            else:
+                self.duties[i] = duty + step
+
+    def _write(self):
+        duties = [int(round(d)) for d in self.duties]
+        if duties == self.written:
+            return
+        self.written = duties
+        self.writes += 1
+        if self.bus is None:
+            try:
+                self.robot.set_wheels(duties)
+            except Exception as e:
+                self._write_failed(duties, e)
+            return
+
+        priority = PRIORITY_MOTOR if any(duties) else PRIORITY_STOP
+        future = self.bus.submit(priority, 'wheels', self.robot.set_wheels, duties)
+        future.add_done_callback(lambda f: self._write_done(duties, f))
+
+    def _emergency_stop(self):
+        """Drop the ramp and stop the wheels at once, bypassing the queue."""
+        self.setpoint = STOP
+        self.targets = [0.0] * WHEELS
+        self.duties = [0.0] * WHEELS
+        self.accels = [0.0] * WHEELS
+        self.written = None
+        try:
+            if self.bus is None:
+                self.robot.t_stop(0)
+            else:
+                self.bus.submit(PRIORITY_STOP, 'wheels', self.robot.t_stop, 0)
+        except Exception as e:
+            logger.error(f"Error stopping motors: {e}")
+
+    def _write_done(self, duties, future):
+        if future.exception() is not None:
+            self._write_failed(duties, future.exception())
+
+    def _write_failed(self, duties, error):
+        # Unknown motor state: make sure the next tick writes again
+        logger.error(f"Error writing wheel duties {duties}: {error}")
+        self.written = None
+
+    def get_stats(self):
+        """Return the setpoint, ramp state and control loop timing."""
+        timing = self.pacer.get_stats()
+        return {
+            'setpoint': list(self.setpoint),
+            'targets': [round(t, 1) for t in self.targets],
+            'duties': self.written,
+            'commands': self.commands,
+            'superseded': self.superseded,
+            'deadman_stops': self.deadman_stops,
+            'writes': self.writes,
+            'loop_rate': timing['fps'],
+            'loop_jitter_ms': timing['jitter_ms'],
+            'missed_ticks': timing['skipped'],
+            'overruns': self.overruns,
+            'errors': self.errors,
+            'max_loop_ms': round(self.max_loop_ms, 2)
+        }
+
+    def close(self):
+        """Stop the motors immediately and end the controller thread."""
+        self.is_running = False
+        self.thread.join(timeout=1.0)
+        if self.bus is None:
+            self.robot.t_stop(0)
+        else:
+            self.bus.call(PRIORITY_STOP, 'wheels', self.robot.t_stop, 0, timeout=1.0)
+
+
+def offer_movement(inputs, sid, data, speed, ticket=None):
+    """
+    Offer a 'movement' event from a client to an InputCoalescer.
+
+    This is the movement handler minus the web server around it, shared by
+    app.py and benchmark.py. The setpoint holds for the deadman timeout and
+    the joystick repeats it while held; clients cannot ask for longer. A
+    stop is applied even if a newer input overtook it.
+
+    Returns:
+        str: The direction, or None if it is unknown
+    """
+    direction = data.get('direction')
+    if direction not in DIRECTIONS:
+        return None
+    inputs.offer(sid, ('movement', direction, speed, None),
+                 urgent=direction == 'stop', ticket=ticket)
+    return direction
+
+
+class InputCoalescer:
+    """
+    Per-client rejection of stale movement input.
+
+    Socket.IO runs every event on its own thread, so the handlers of one
+    client's inputs can finish out of order. Each input takes a ticket from
+    receive() when its handler starts; offer() applies it only if no input
+    with a later ticket from the same client was applied first, so a slow
+    handler can never undo a newer command. Picking the newest setpoint per
+    control tick is left to the MotionController mailbox. Urgent intents
+    (stops) are always applied, so a late stop still stops.
+
+    apply is called with the lock held and must not block; posting to the
+    MotionController is fine.
+    """
+
+    def __init__(self, apply):
+        """
+        Args:
+            apply (callable): Called with each intent that is applied
+        """
+        self.apply = apply
+        self.lock = Lock()
+        self.clients = {}  # sid -> per-client state
+        self.received = 0
+        self.applied = 0
+        self.stale = 0
+        self.urgent = 0
+
+    def _client(self, sid):
+        return self.clients.setdefault(sid, {'issued': 0, 'applied': 0,
+                                             'received': 0, 'stale': 0})
+
+    def receive(self, sid):
+        """Take a ticket that orders an input of this client by arrival."""
+        with self.lock:
+            client = self._client(sid)
+            client['issued'] += 1
+            return client['issued']
+
+    def offer(self, sid, intent, urgent=False, ticket=None):
+        """
+        Apply intent unless a newer input of the same client already was.
+
+        Args:
+            sid (str): Client the input came from
+            intent (tuple): Passed to apply
+            urgent (bool): Apply even if the input is stale
+            ticket (int): From receive() when the handler started; None
+                takes one now
+
+        Returns:
+            bool: False if the intent was dropped as stale
+        """
+        with self.lock:
+            client = self._client(sid)
+            if ticket is None:
+                client['issued'] += 1
+                ticket = client['issued']
+            self.received += 1
+            client['received'] += 1
+            if urgent:
+                self.urgent += 1
+            elif ticket < client['applied']:
+                self.stale += 1
+                client['stale'] += 1
+                return False
+            self.apply(intent)
+            self.applied += 1
+            client['applied'] = max(client['applied'], ticket)
+            return True
+
+    def remove(self, sid):
+        """Forget a client that disconnected."""
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def get_stats(self):
+        """Return input counters, in total and per client."""
+        with self.lock:
+            return {
+                'received': self.received,
+                'applied': self.applied,
+                'stale': self.stale,
+                'urgent': self.urgent,
+                'clients': {sid: {'received': c['received'], 'stale': c['stale']}
+                            for sid, c in self.clients.items()}
+            }
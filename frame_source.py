@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import logging
+from abc import ABC, abstractmethod
+import numpy as np
+import cv2
+from config import Config
+from pacing import FramePacer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class FrameSource(ABC):
+    """
+    Base class for anything Camera can capture frames from.
+
+    Implementations follow the cv2.VideoCapture conventions: read() returns
+    (ok, frame) and blocks until the next frame is due, release() frees the
+    underlying resources. When read() is given a preallocated array of the
+    right shape it fills that array in place and returns it.
+    """
+
+    def __init__(self, width, height, fps):
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def is_opened(self):
+        return True
+
+    @abstractmethod
+    def read(self, frame=None):
+        """Return (ok, frame) once the next frame is available."""
+
+    def release(self):
+        pass
+
+
+class PacedFrameSource(FrameSource):
+    """A frame source that produces frames on a fixed schedule."""
+
+    def __init__(self, width, height, fps):
+        super().__init__(width, height, fps)
+        self.pacer = FramePacer(max(1, fps))
+
+    def _wait_for_deadline(self):
+        """Sleep until the next frame is due, like a real sensor would."""
+        self.pacer.wait()
+
+
+class OpenCVFrameSource(FrameSource):
+    """A V4L2/USB camera opened through cv2.VideoCapture."""
+
+    def __init__(self, device, width, height, fps, passthrough=False):
+        super().__init__(width, height, fps)
+        self.capture = cv2.VideoCapture(device)
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.capture.set(cv2.CAP_PROP_FPS, fps)
+        # Keep the driver queue short so we never read stale frames
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        if passthrough:
+            # Ask for MJPG and hand back the compressed buffer undecoded
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+            self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            logger.info("Requested native MJPEG passthrough from camera")
+
+    def is_opened(self):
+        return self.capture.isOpened()
+
+    def read(self, frame=None):
+        if frame is None:
+            ret, frame = self.capture.read()
+        else:
+            ret, frame = self.capture.read(frame)
+        if ret and frame.ndim == 2 and frame.shape[0] == 1:
+            # With CONVERT_RGB off V4L2 returns the MJPEG bitstream as a 1xN
+            # Mat; hand it on as the flat buffer cv2.imdecode expects
+            frame = frame.reshape(-1)
+        return ret, frame
+
+    def release(self):
+        self.capture.release()
+
+
+class SyntheticFrameSource(PacedFrameSource):
+    """
+    Generates a moving test pattern at a configurable resolution and rate.
+
+    Useful for benchmarking the capture/encode/stream path on machines
+    without a camera. The 'bars' pattern compresses like a typical scene;
+    'noise' is a worst case for the JPEG encoder.
+    """
+
+    def __init__(self, width, height, fps, pattern='bars'):
+        super().__init__(width, height, fps)
+        self.pattern = pattern
+        self.frame_count = 0
+
+        # Precompute colour bars; each frame only shifts them
+        colors = np.array([[255, 255, 255], [0, 255, 255], [255, 255, 0], [0, 255, 0],
+                           [255, 0, 255], [0, 0, 255], [255, 0, 0], [0, 0, 0]], dtype=np.uint8)
+        columns = (np.arange(width) * len(colors) // width)
+        self.bars = np.broadcast_to(colors[columns], (height, width, 3)).copy()
+        self.rng = np.random.default_rng(0)
+
+    def read(self, frame=None):
+        self._wait_for_deadline()
+        self.frame_count += 1
+
+        if frame is None or frame.shape != self.bars.shape:
+            frame = np.empty_like(self.bars)
+
+        if self.pattern == 'noise':
+            frame[...] = self.rng.integers(0, 256, frame.shape, dtype=np.uint8)
+        else:
+            # Scroll the bars by writing the two halves in place
+            shift = (self.frame_count * 4) % self.width
+            frame[:, shift:] = self.bars[:, :self.width - shift]
+            frame[:, :shift] = self.bars[:, self.width - shift:]
+
+        cv2.putText(frame, f"#{self.frame_count}", (10, self.height - 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (128, 128, 128), 2, cv2.LINE_AA)
+        return True, frame
+
+
+class ReplayFrameSource(PacedFrameSource):
+    """
+    Replays a video file or an image sequence at the configured rate.
+
+    The path may be a video file, a directory of images or a glob pattern.
+    Frames are resized to the configured resolution so downstream stages see
+    the same geometry as with the real camera.
+    """
+
+    def __init__(self, path, width, height, fps, loop=True):
+        super().__init__(width, height, fps)
+        self.path = path
+        self.loop = loop
+        self.images = None
+        self.index = 0
+        self.capture = None
+
+        if os.path.isdir(path):
+            self.images = sorted(p for p in glob.glob(os.path.join(path, '*'))
+                                 if p.lower().endswith(IMAGE_EXTENSIONS))
+        elif any(ch in path for ch in '*?['):
+            self.images = sorted(glob.glob(path))
+        else:
+            self.capture = cv2.VideoCapture(path)
+
+        if self.images is not None and not self.images:
+            raise Exception(f"No images found for replay: {path}")
+
+    def is_opened(self):
+        if self.images is not None:
+            return True
+        return self.capture.isOpened()
+
+    def _next_raw_frame(self):
+        if self.images is not None:
+            if self.index >= len(self.images):
+                if not self.loop:
+                    return False, None
+                self.index = 0
+            frame = cv2.imread(self.images[self.index])
+            self.index += 1
+            return frame is not None, frame
+
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return ret, frame
+
+    def read(self, frame=None):
+        self._wait_for_deadline()
+        ret, raw = self._next_raw_frame()
+        if not ret:
+            return False, None
+        if frame is None or frame.shape != (self.height, self.width, 3):
+            frame = None
+        if raw.shape[1] != self.width or raw.shape[0] != self.height:
+            return True, cv2.resize(raw, (self.width, self.height), dst=frame,
+                                    interpolation=cv2.INTER_AREA)
+        if frame is None:
+            return True, raw
+        np.copyto(frame, raw)
+        return True, frame
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+
+def create_frame_source(config=None):
+    """
+    Create the frame source selected by Config.CAMERA_SOURCE.
+
+    Returns:
+        FrameSource: 'opencv' (default), 'synthetic' or 'replay'
+    """
+    config = config or Config()
+    source = config.CAMERA_SOURCE.lower()
+    width, height, fps = config.CAMERA_WIDTH, config.CAMERA_HEIGHT, config.CAMERA_FRAMERATE
+
+    if source == 'synthetic':
+        logger.info(f"Using synthetic frame source ({width}x{height}@{fps})")
+        return SyntheticFrameSource(width, height, fps, config.CAMERA_SYNTHETIC_PATTERN)
+    if source == 'replay':
+        if not config.CAMERA_REPLAY_PATH:
+            raise Exception("CAMERA_REPLAY_PATH must be set for the replay frame source")
+        logger.info(f"Using replay frame source: {config.CAMERA_REPLAY_PATH}")
+        return ReplayFrameSource(config.CAMERA_REPLAY_PATH, width, height, fps,
+                                 config.CAMERA_REPLAY_LOOP)
+    if source != 'opencv':
+        raise Exception(f"Unknown camera source: {config.CAMERA_SOURCE}")
+
+    device = config.CAMERA_DEVICE
+    device = int(device) if device.isdigit() else device
+    return OpenCVFrameSource(device, width, height, fps, config.CAMERA_MJPEG_PASSTHROUGH)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+from threading import Condition, Thread
+from config import Config
+from pacing import FramePacer
+from bus_worker import PRIORITY_SERVO
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Servo angle limits in degrees
+SERVO_MIN = 0
+SERVO_MAX = 180
+
+
+class GimbalController:
+    """
+    Single owner of the camera gimbal servos.
+
+    set_pose() only records the requested pose, so a stream of joystick
+    events costs the caller nothing and poses that arrive between two ticks
+    replace each other. A thread slews each axis toward its target at
+    GIMBAL_CONTROL_RATE, moving at most GIMBAL_MAX_RATE degrees per second,
+    and writes both servos in one batched update only when the PWM count of
+    an axis actually changed. The thread sleeps while the gimbal is at rest.
+
+    Where the servos are before the first pose is unknown, so the first
+    pose is written directly rather than slewed to.
+    """
+
+    def __init__(self, robot, config=None, bus=None):
+        """Initialize the controller and start its thread."""
+        self.config = config or Config()
+        self.robot = robot
+        self.bus = bus
+        self.channels = (self.config.HORIZONTAL_SERVO_CHANNEL, self.config.VERTICAL_SERVO_CHANNEL)
+        self.centers = (self.config.HORIZONTAL_SERVO_DEFAULT, self.config.VERTICAL_SERVO_DEFAULT)
+        self.tick = 1.0 / self.config.GIMBAL_CONTROL_RATE
+        self.pacer = FramePacer(self.config.GIMBAL_CONTROL_RATE)
+        self.condition = Condition()
+        self.target = None  # Requested servo angles per axis
+        self.position = None  # Commanded servo angles per axis
+        self.written = None  # PWM counts last sent per axis
+        self.is_running = True
+
+        self.poses = 0
+        self.superseded = 0
+        self.writes = 0
+        self.skipped = 0
+        self.errors = 0
+        self.fresh = False
+
+        self.thread = Thread(target=self._run, name="gimbal-controller")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"Gimbal controller started ({self.config.GIMBAL_CONTROL_RATE} Hz, "
+                    f"max {self.config.GIMBAL_MAX_RATE} deg/s)")
+
+    def set_pose(self, horizontal, vertical):
+        """
+        Request a new pose without waiting for the servos.
+
+        Args:
+            horizontal (float): Pan offset from center in degrees
+            vertical (float): Tilt offset from center in degrees
+        """
+        target = tuple(min(SERVO_MAX, max(SERVO_MIN, center + float(offset)))
+                       for center, offset in zip(self.centers, (horizontal, vertical)))
+        with self.condition:
+            if self.fresh:
+                self.superseded += 1
+            self.target = target
+            self.fresh = True
+            self.poses += 1
+            self.condition.notify()
+
+    def _run(self):
+        while self.is_running:
+            with self.condition:
+                idle = False
+                while self.is_running and (self.target is None or self.target == self.position):
+                    idle = True
+                    self.condition.wait()
+                if not self.is_running:
+                    break
+                target = self.target
+                self.fresh = False
+
+            if idle:
+                # Start a new schedule instead of catching up on the rest
+                self.pacer.reset()
+            self.pacer.wait()
+
+            self.position = self._slew(self.position, target)
+            self._write(self.position)
+
+    def _slew(self, position, target):
+        """Move each axis toward its target by at most one tick's worth."""
+        max_step = self.config.GIMBAL_MAX_RATE * self.tick
+        if position is None or max_step <= 0:
+            return target
+        return tuple(p + max(-max_step, min(max_step, t - p)) for p, t in zip(position, target))
+
+    def _write(self, position):
+        counts = tuple(self.robot.servo_pwm(angle) for angle in position)
+        if counts == self.written:
+            # Less than one PWM step since the last write
+            self.skipped += 1
+            return
+        # Always send both axes: a queued write may be replaced by this one,
+        # and the PCA9685 shadow cache drops the channel that did not change
+        angles = dict(zip(self.channels, position))
+        self.written = counts
+        self.writes += 1
+        if self.bus is None:
+            try:
+                self.robot.set_servo_angles(angles)
+            except Exception as e:
+                self._write_failed(e)
+            return
+
+        future = self.bus.submit(PRIORITY_SERVO, 'gimbal', self.robot.set_servo_angles, angles)
+        future.add_done_callback(self._write_done)
+
+    def _write_done(self, future):
+        if future.exception() is not None:
+            self._write_failed(future.exception())
+
+    def _write_failed(self, error):
+        logger.error(f"Error writing gimbal servos: {error}")
+        self.errors += 1
+        # Unknown servo state: write everything again on the next tick
+        with self.condition:
+            self.written = None
+            self.position = None
+            self.condition.notify()
+
+    def get_stats(self):
+        """Return the pose and write counters."""
+        with self.condition:
+            return {
+                'target': list(self.target) if self.target else None,
+                'position': [round(p, 1) for p in self.position] if self.position else None,
+                'poses': self.poses,
+                'superseded': self.superseded,
+                'writes': self.writes,
+                'skipped': self.skipped,
+                'errors': self.errors
+            }
+
+    def close(self):
+        """End the controller thread."""
+        with self.condition:
+            self.is_running = False
+            self.condition.notify()
+        self.thread.join(timeout=1.0)
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import errno
+import random
+import logging
+from collections import deque
+from threading import Lock
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# PCA9685 MODE1 register and its auto-increment bit
+PCA9685_MODE1 = 0x00
+PCA9685_MODE1_AI = 0x20
+# Largest payload of an SMBus block transfer
+SMBUS_BLOCK_MAX = 32
+
+
+class PiBackend:
+    """
+    The real hardware: smbus2 for I2C and gpiozero for GPIO pins.
+
+    Both libraries are imported here rather than at module level so the
+    rest of the control path can be loaded on machines without them.
+    """
+
+    name = 'pi'
+
+    def __init__(self):
+        import smbus2
+        from gpiozero import LED
+        self.SMBus = smbus2.SMBus
+        self.i2c_msg = smbus2.i2c_msg
+        self.LED = LED
+
+    def get_stats(self):
+        return {'backend': self.name}
+
+
+class TransactionLog:
+    """Timestamped record of every simulated bus and GPIO transaction."""
+
+    def __init__(self, size):
+        self.lock = Lock()
+        self.entries = deque(maxlen=size)
+        self.counts = {}
+        self.bytes = 0
+        self.errors = 0
+
+    def record(self, kind, address, register, data=()):
+        with self.lock:
+            self.entries.append((time.monotonic(), kind, address, register, bytes(data)))
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.bytes += len(data)
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def transactions(self):
+        """Return the recorded (time, kind, address, register, data) tuples."""
+        with self.lock:
+            return list(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counts = {}
+            self.bytes = 0
+            self.errors = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'transactions': sum(n for kind, n in self.counts.items() if kind != 'gpio'),
+                'gpio_writes': self.counts.get('gpio', 0),
+                'by_kind': dict(self.counts),
+                'bytes': self.bytes,
+                'errors': self.errors
+            }
+
+
+class SimulatedI2CMessage:
+    """Stand-in for smbus2.i2c_msg used with SimulatedI2CBus.i2c_rdwr."""
+
+    def __init__(self, address, is_read, data):
+        self.addr = address
+        self.is_read = is_read
+        self.buf = bytearray(data)
+
+    @staticmethod
+    def write(address, data):
+        return SimulatedI2CMessage(address, False, data)
+
+    @staticmethod
+    def read(address, length):
+        return SimulatedI2CMessage(address, True, bytes(length))
+
+    def __iter__(self):
+        return iter(self.buf)
+
+    def __len__(self):
+        return len(self.buf)
+
+
+class SimulatedI2CBus:
+    """
+    An smbus2.SMBus look-alike with PCA9685-style register files.
+
+    Every device address gets 256 registers. Multi-byte transfers advance
+    the register pointer only while the MODE1 auto-increment bit is set,
+    like the real chip, so code that forgets to enable it writes garbage
+    here too. Transfers take the time they would on a real bus and can be
+    made to fail at random.
+    """
+
+    def __init__(self, bus_number, log, config):
+        self.bus_number = bus_number
+        self.log = log
+        self.config = config
+        self.lock = Lock()
+        self.registers = {}
+        self.random = random.Random(0)
+
+    def _device(self, address):
+        return self.registers.setdefault(address, bytearray(256))
+
+    def _transfer(self, kind, address, register, data, payload_bytes):
+        """Account for one transaction: latency, error injection and logging."""
+        # Start + address byte + register byte + payload at the modelled bus speed
+        delay = (self.config.SIM_I2C_LATENCY_US +
+                 self.config.SIM_I2C_BYTE_US * (2 + payload_bytes)) / 1e6
+        end = time.perf_counter() + delay
+        while time.perf_counter() < end:
+            pass
+
+        if self.config.SIM_I2C_ERROR_RATE and self.random.random() < self.config.SIM_I2C_ERROR_RATE:
+            self.log.record_error()
+            raise OSError(errno.EREMOTEIO, f"Simulated I2C error on {kind} to 0x{address:02X}")
+        self.log.record(kind, address, register, data)
+
+    def _write(self, address, register, data):
+        regs = self._device(address)
+        increment = regs[PCA9685_MODE1] & PCA9685_MODE1_AI
+        for value in data:
+            regs[register] = value & 0xFF
+            if increment:
+                register = (register + 1) & 0xFF
+
+    def _read(self, address, register, length):
+        regs = self._device(address)
+        increment = regs[PCA9685_MODE1] & PCA9685_MODE1_AI
+        result = []
+        for _ in range(length):
+            result.append(regs[register])
+            if increment:
+                register = (register + 1) & 0xFF
+        return result
+
+    def write_byte_data(self, address, register, value):
+        with self.lock:
+            self._transfer('write_byte', address, register, [value], 1)
+            self._write(address, register, [value])
+
+    def read_byte_data(self, address, register):
+        with self.lock:
+            self._transfer('read_byte', address, register, (), 1)
+            return self._read(address, register, 1)[0]
+
+    def write_i2c_block_data(self, address, register, data):
+        if len(data) > SMBUS_BLOCK_MAX:
+            raise ValueError(f"Data length cannot exceed {SMBUS_BLOCK_MAX} bytes")
+        with self.lock:
+            self._transfer('write_block', address, register, data, len(data))
+            self._write(address, register, list(data))
+
+    def read_i2c_block_data(self, address, register, length):
+        if length > SMBUS_BLOCK_MAX:
+            raise ValueError(f"Desired block length over {SMBUS_BLOCK_MAX} bytes")
+        with self.lock:
+            self._transfer('read_block', address, register, (), length)
+            return self._read(address, register, length)
+
+    def i2c_rdwr(self, *messages):
+        """Combined transfer: a write sets the register pointer for a following read."""
+        with self.lock:
+            pointer = {}
+            size = sum(len(m) for m in messages)
+            first = messages[0]
+            register = first.buf[0] if not first.is_read and first.buf else None
+            self._transfer('rdwr', first.addr, register,
+                           b''.join(bytes(m.buf) for m in messages if not m.is_read), size)
+            for message in messages:
+                if message.is_read:
+                    message.buf[:] = bytes(self._read(message.addr, pointer.get(message.addr, 0),
+                                                      len(message)))
+                elif message.buf:
+                    pointer[message.addr] = message.buf[0]
+                    self._write(message.addr, message.buf[0], list(message.buf[1:]))
+
+    def close(self):
+        pass
+
+
+class SimulatedPin:
+    """A gpiozero.LED look-alike that logs every change of its output."""
+
+    def __init__(self, pin, log, config):
+        self.pin = pin
+        self.log = log
+        self.config = config
+        self.value = 0
+
+    def _set(self, value):
+        if self.config.SIM_GPIO_LATENCY_US:
+            end = time.perf_counter() + self.config.SIM_GPIO_LATENCY_US / 1e6
+            while time.perf_counter() < end:
+                pass
+        self.value = value
+        self.log.record('gpio', None, self.pin, [value])
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+    @property
+    def is_lit(self):
+        return bool(self.value)
+
+    def close(self):
+        pass
+
+
+class SimulatedBackend:
+    """
+    Simulated PCA9685/I2C bus and GPIO pins for running off the Pi.
+
+    All buses and pins share one TransactionLog, so tests and benchmarks can
+    count transactions per command and inspect their timing.
+    """
+
+    name = 'sim'
+    i2c_msg = SimulatedI2CMessage
+
+    def __init__(self, config=None):
+        self.config = config or Config()
+        self.log = TransactionLog(self.config.SIM_LOG_SIZE)
+        self.buses = {}
+
+    def SMBus(self, bus_number=1):
+        # Devices on the same bus number share their registers
+        if bus_number not in self.buses:
+            self.buses[bus_number] = SimulatedI2CBus(bus_number, self.log, self.config)
+        return self.buses[bus_number]
+
+    def LED(self, pin):
+        return SimulatedPin(pin, self.log, self.config)
+
+    def get_stats(self):
+        stats = {'backend': self.name}
+        stats.update(self.log.get_stats())
+        return stats
+
+
+_default_backend = None
+
+
+def create_backend(config=None):
+    """
+    Return the hardware backend selected by Config.HARDWARE_BACKEND.
+
+    The backend is shared, so the motors and anything else on the bus see
+    the same (real or simulated) devices.
+
+    Returns:
+        PiBackend or SimulatedBackend: 'pi' (default) or 'sim'
+    """
+    global _default_backend
+    if _default_backend is not None and config is None:
+        return _default_backend
+
+    config = config or Config()
+    backend = config.HARDWARE_BACKEND.lower()
+    if backend == 'sim':
+        logger.info("Using simulated I2C/GPIO hardware backend")
+        instance = SimulatedBackend(config)
+    elif backend == 'pi':
+        instance = PiBackend()
+    else:
+        raise Exception(f"Unknown hardware backend: {config.HARDWARE_BACKEND}")
+
+    if _default_backend is None:
+        _default_backend = instance
+    return instance
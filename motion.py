@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import numpy as np
+import cv2
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Size of the thumbnail frames are compared at
+THUMBNAIL_SIZE = (80, 60)
+
+
+class MotionDetector:
+    """
+    Cheap change detector used to stop streaming a static scene.
+
+    Each frame is reduced to a small grayscale thumbnail and compared with
+    the thumbnail of the last frame that was actually sent. Pixels that moved
+    by more than STREAM_MOTION_PIXEL_DELTA count as changed; when fewer than
+    STREAM_MOTION_THRESHOLD of them did, the frame is suppressed. A frame is
+    let through at least every STREAM_IDLE_REFRESH seconds regardless, so
+    the picture and its timestamp never go completely stale.
+    """
+
+    def __init__(self, config=None):
+        """Initialize the detector with configuration settings."""
+        self.config = config or Config()
+        width, height = THUMBNAIL_SIZE
+        self.small = np.empty((height, width, 3), dtype=np.uint8)
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.diff = np.empty((height, width), dtype=np.int16)
+        self.reference = None
+        self.last_accept_time = 0.0
+        self.force_next = True
+        self.accepted = 0
+        self.suppressed = 0
+        self.last_change = 1.0
+
+    def force(self):
+        """Let the next frame through, e.g. because a new viewer joined."""
+        self.force_next = True
+
+    def _thumbnail(self, frame):
+        """Reduce a BGR frame or a compressed JPEG buffer to the gray thumbnail."""
+        if frame.ndim == 1:
+            # Passthrough JPEG: libjpeg can decode straight to 1/8 scale grayscale
+            reduced = cv2.imdecode(frame, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if reduced is None:
+                return None
+            cv2.resize(reduced, THUMBNAIL_SIZE, dst=self.gray, interpolation=cv2.INTER_AREA)
+            return self.gray
+        cv2.resize(frame, THUMBNAIL_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return self.gray
+
+    def _changed_fraction(self, gray):
+        """Fraction of thumbnail pixels that differ from the reference."""
+        np.subtract(gray, self.reference, out=self.diff, dtype=np.int16)
+        np.abs(self.diff, out=self.diff)
+        return np.count_nonzero(self.diff > self.config.STREAM_MOTION_PIXEL_DELTA) / self.diff.size
+
+    def should_send(self, frame, now=None):
+        """
+        Decide whether a frame differs enough from the last one sent.
+
+        Accepting a frame makes it the new reference.
+
+        Returns:
+            bool: True if the frame should be encoded and sent
+        """
+        if not self.config.STREAM_MOTION_GATE:
+            return True
+        now = now or time.monotonic()
+
+        gray = self._thumbnail(frame)
+        if gray is None:
+            return True
+
+        accept = self.force_next or self.reference is None
+        if not accept:
+            self.last_change = self._changed_fraction(gray)
+            accept = (self.last_change >= self.config.STREAM_MOTION_THRESHOLD or
+                      now - self.last_accept_time >= self.config.STREAM_IDLE_REFRESH)
+
+        if not accept:
+            self.suppressed += 1
+            return False
+
+        if self.reference is None:
+            self.reference = gray.copy()
+        else:
+            np.copyto(self.reference, gray)
+        self.force_next = False
+        self.last_accept_time = now
+        self.accepted += 1
+        return True
+
+    def get_stats(self):
+        """Return how many frames were let through and suppressed."""
+        return {
+            'enabled': self.config.STREAM_MOTION_GATE,
+            'accepted': self.accepted,
+            'suppressed': self.suppressed,
+            'last_change': round(float(self.last_change), 4)
+        }
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import math
+from collections import deque
+
+
+class FramePacer:
+    """
+    Schedules frames against monotonic-clock deadlines.
+
+    Deadlines advance by exactly one frame interval, so the long-run rate
+    matches the target instead of drifting with per-frame work. When the
+    caller falls behind, missed slots are skipped rather than sent in a
+    burst. The pacer also measures the achieved frame rate and jitter.
+
+    Use wait()/reserve() in loops that produce frames on their own, and
+    is_due() to decimate a stream of frames that arrive from elsewhere.
+    """
+
+    def __init__(self, fps, window=60):
+        self.next_deadline = None
+        self.last_tick = None
+        self.intervals = deque(maxlen=window)
+        self.frames = 0
+        self.skipped = 0
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        """Change the target rate; takes effect from the next deadline."""
+        self.fps = max(float(fps), 0.1)
+        self.interval = 1.0 / self.fps
+
+    def reset(self):
+        """Forget the schedule, e.g. after the stream was paused."""
+        self.next_deadline = None
+        self.last_tick = None
+
+    def _advance(self, now):
+        """Move to the next deadline, skipping any slots already missed."""
+        self.next_deadline += self.interval
+        if self.next_deadline <= now:
+            missed = int((now - self.next_deadline) / self.interval) + 1
+            self.skipped += missed
+            self.next_deadline += missed * self.interval
+
+    def tick(self, now=None):
+        """Record that a frame went out at now (for fps/jitter accounting)."""
+        now = time.monotonic() if now is None else now
+        if self.last_tick is not None:
+            self.intervals.append(now - self.last_tick)
+        self.last_tick = now
+        self.frames += 1
+
+    def reserve(self, now=None):
+        """
+        Claim the next deadline without sleeping.
+
+        Returns:
+            float: Seconds the caller should wait before producing the frame
+        """
+        now = time.monotonic() if now is None else now
+        if self.next_deadline is None:
+            self.next_deadline = now
+        delay = max(0.0, self.next_deadline - now)
+        self.tick(now + delay)
+        self._advance(now + delay)
+        return delay
+
+    def wait(self):
+        """Block until the next deadline."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def is_due(self, now=None, tolerance=0.0, advance=True):
+        """
+        Decide whether a frame arriving at now should be used.
+
+        Args:
+            now (float): Monotonic arrival time of the frame
+            tolerance (float): How early a frame may arrive and still count,
+                typically half the source's frame interval so capture jitter
+                does not cause a whole frame to be skipped
+            advance (bool): False to only look, e.g. when the frame may
+                still be dropped for another reason
+
+        Returns:
+            bool: True if the frame should be sent; the schedule advances
+                unless advance is False
+        """
+        now = time.monotonic() if now is None else now
+        if self.next_deadline is not None and now < self.next_deadline - tolerance:
+            return False
+        if not advance:
+            return True
+        if self.next_deadline is None:
+            self.next_deadline = now
+        self.tick(now)
+        self._advance(max(now, self.next_deadline))
+        return True
+
+    def get_stats(self):
+        """Return target and achieved frame rate, jitter and skip counts."""
+        intervals = list(self.intervals)
+        if intervals:
+            mean = sum(intervals) / len(intervals)
+            jitter = math.sqrt(sum((i - mean) ** 2 for i in intervals) / len(intervals))
+            achieved = 1.0 / mean if mean > 0 else 0.0
+        else:
+            jitter = 0.0
+            achieved = 0.0
+        return {
+            'target_fps': round(self.fps, 2),
+            'fps': round(achieved, 2),
+            'jitter_ms': round(jitter * 1000, 2),
+            'frames': self.frames,
+            'skipped': self.skipped
+        }
@@ -10,7 +10,7 @@
 // Start the camera stream
 function startCamera() {
     if (socket) {
-        socket.emit('start_stream');
+        socket.emit('start_stream', { binary: true });
         console.log('Camera stream started');
     }
 }
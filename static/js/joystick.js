@@ -18,6 +18,21 @@ let lastDirection = '';
 let movementIntervalId = null;
 let cameraIntervalId = null;
 
+// Binary control frames, see control.py: version, flags, sequence number,
+// timestamp, quantized drive axes and gimbal angles
+const CONTROL_VERSION = 1;
+const CONTROL_FRAME_SIZE = 15;
+const CONTROL_AXIS_SCALE = 127;
+const CONTROL_FLAG_STOP = 0x01;
+const CONTROL_FLAG_DRIVE = 0x02;
+const CONTROL_FLAG_GIMBAL = 0x04;
+const CONTROL_FLAG_ACK = 0x80;
+const CONTROL_ACK_EVERY = 10; // Ask for a round trip sample every 10 frames
+
+let controlSeq = 0;
+const controlAckPending = new Map(); // seq -> send time
+let controlRoundTrip = null; // Last control round trip in ms
+
 // Initialize joysticks when DOM is loaded
 document.addEventListener('DOMContentLoaded', () => {
     // Initialize movement joystick
@@ -176,52 +191,10 @@ class Joystick {
  * @param {number} y - Normalized Y position (-1 to 1)
  */
 function handleMovementJoystick(x, y) {
-    // Threshold for detecting movement
-    const threshold = 0.3;
-    
-    // Determine direction based on joystick position
-    let direction = null;
-    
-    // Calculate absolute values
-    const absX = Math.abs(x);
-    const absY = Math.abs(y);
-    
-    // Check if joystick is in neutral position
-    if (absX < threshold && absY < threshold) {
-        direction = 'stop';
-    }
-    // Check if movement is primarily horizontal
-    else if (absX > absY) {
-        if (x > threshold) {
-            direction = 'moveRight';
-        } else if (x < -threshold) {
-            direction = 'moveLeft';
-        }
-    }
-    // Check if movement is primarily vertical
-    else if (absY > absX) {
-        if (y < -threshold) {
-            direction = 'forward';
-        } else if (y > threshold) {
-            direction = 'backward';
-        }
-    }
-    // Check for diagonal movement
-    else {
-        if (x > threshold && y < -threshold) {
-            direction = 'forwardRight';
-        } else if (x < -threshold && y < -threshold) {
-            direction = 'forwardLeft';
-        } else if (x > threshold && y > threshold) {
-            direction = 'backwardRight';
-        } else if (x < -threshold && y > threshold) {
-            direction = 'backwardLeft';
-        }
-    }
-    
-    // Send movement command to server if direction is determined
-    if (direction) {
-        socket.emit('movement', { direction, duration: 0.1 });
+    // While the stick is held, sendMovementCommand streams analog velocity
+    // commands; this handler only reports the handle snapping back to centre
+    if (x === 0 && y === 0) {
+        sendControlFrame(CONTROL_FLAG_STOP);
     }
 }
 
@@ -242,14 +215,56 @@ function handleCameraJoystick(x, y) {
     document.getElementById('vertical-angle').textContent = verticalAngle + '°';
     
     // Send camera control command to server
-    socket.emit('camera_control', {
-        horizontal: horizontalAngle,
-        vertical: verticalAngle
-    });
+    sendControlFrame(CONTROL_FLAG_GIMBAL, 0, 0, 0, horizontalAngle, verticalAngle);
+}
+
+/**
+ * Send one binary control frame
+ * @param {number} flags - CONTROL_FLAG_* bits
+ * @param {number} vx - Forward velocity (-1 to 1)
+ * @param {number} vy - Leftward velocity (-1 to 1)
+ * @param {number} omega - Counter-clockwise rotation (-1 to 1)
+ * @param {number} pan - Gimbal pan in degrees from center
+ * @param {number} tilt - Gimbal tilt in degrees from center
+ */
+function sendControlFrame(flags, vx = 0, vy = 0, omega = 0, pan = 0, tilt = 0) {
+    const quantize = (v) => Math.max(-CONTROL_AXIS_SCALE,
+        Math.min(CONTROL_AXIS_SCALE, Math.round(v * CONTROL_AXIS_SCALE)));
+    const angle = (v) => Math.max(-128, Math.min(127, Math.round(v)));
+    const now = performance.now();
+    
+    controlSeq = (controlSeq + 1) >>> 0;
+    if (controlSeq % CONTROL_ACK_EVERY === 0) {
+        flags |= CONTROL_FLAG_ACK;
+        controlAckPending.clear(); // Older samples are lost or too late to matter
+        controlAckPending.set(controlSeq, now);
+    }
+    
+    const view = new DataView(new ArrayBuffer(CONTROL_FRAME_SIZE));
+    view.setUint8(0, CONTROL_VERSION);
+    view.setUint8(1, flags);
+    view.setUint32(2, controlSeq, true);
+    view.setUint32(6, Math.floor(now) >>> 0, true);
+    view.setInt8(10, quantize(vx));
+    view.setInt8(11, quantize(vy));
+    view.setInt8(12, quantize(omega));
+    view.setInt8(13, angle(pan));
+    view.setInt8(14, angle(tilt));
+    socket.emit('control', view.buffer);
+}
+
+// Round trip of the control link from acknowledged frames
+function handleControlAck(data) {
+    const sentAt = controlAckPending.get(data.seq);
+    if (sentAt === undefined) return;
+    controlAckPending.delete(data.seq);
+    controlRoundTrip = performance.now() - sentAt;
 }
 
 // Initialize joysticks
 function initializeJoysticks() {
+    socket.on('control_ack', handleControlAck);
+    
     // Get DOM elements
     const movementJoystick = document.getElementById('movement-joystick');
     const movementBase = movementJoystick.querySelector('.joystick-base');
@@ -423,41 +438,28 @@ function setupJoystick(joystickElement, baseElement, handleElement, moveCallback
 function sendMovementCommand(overrideDirection = null) {
     if (!movementJoystickActive && !overrideDirection) return;
     
-    let direction;
-    
     if (overrideDirection) {
-        direction = overrideDirection;
-    } else {
-        // Calculate movement direction based on joystick position
-        const x = movementJoystickX;
-        const y = -movementJoystickY; // Invert Y so up is positive
-        
-        if (Math.abs(x) < DEAD_ZONE && Math.abs(y) < DEAD_ZONE) {
-            direction = 'stop';
-        } else if (Math.abs(y) > Math.abs(x)) {
-            // More vertical than horizontal movement
-            if (y > 0) {
-                // Forward
-                if (x > 0.5) direction = 'forwardRight';
-                else if (x < -0.5) direction = 'forwardLeft';
-                else direction = 'forward';
-            } else {
-                // Backward
-                if (x > 0.5) direction = 'backwardRight';
-                else if (x < -0.5) direction = 'backwardLeft';
-                else direction = 'backward';
-            }
+        lastDirection = overrideDirection;
+        if (overrideDirection === 'stop') {
+            sendControlFrame(CONTROL_FLAG_STOP);
         } else {
-            // More horizontal than vertical movement
-            if (x > 0) direction = 'right';
-            else direction = 'left';
+            socket.emit('movement', { direction: overrideDirection });
         }
+        return;
     }
     
-    // Only send if different from last direction
-    if (direction !== lastDirection) {
-        lastDirection = direction;
-        socket.emit('movement', { direction });
+    // Proportional control: stick up drives forward, sideways turns
+    const x = movementJoystickX;
+    const y = -movementJoystickY; // Invert Y so up is positive
+    const inDeadZone = Math.abs(x) < DEAD_ZONE && Math.abs(y) < DEAD_ZONE;
+    
+    // Repeat every tick while the stick is held: the server stops the
+    // motors if it stops hearing from us (deadman timeout)
+    lastDirection = inDeadZone ? 'stop' : 'analog';
+    if (inDeadZone) {
+        sendControlFrame(CONTROL_FLAG_DRIVE);
+    } else {
+        sendControlFrame(CONTROL_FLAG_DRIVE, y, 0, -x);
     }
 }
 
@@ -469,10 +471,7 @@ function sendCameraCommand() {
     const horizontalAngle = Math.round(cameraJoystickX * 45); // -45 to 45 degrees
     const verticalAngle = Math.round(-cameraJoystickY * 20); // -20 to 20 degrees
     
-    socket.emit('camera_control', {
-        horizontal: horizontalAngle,
-        vertical: verticalAngle
-    });
+    sendControlFrame(CONTROL_FLAG_GIMBAL, 0, 0, 0, horizontalAngle, verticalAngle);
 }
 
 // Export functions
@@ -8,6 +8,8 @@ const socket = io();
 
 // DOM elements
 const videoFeed = document.getElementById('video-feed');
+const videoWebRTC = document.getElementById('video-webrtc');
+const videoTimestamp = document.getElementById('video-timestamp');
 const speedSlider = document.getElementById('speed-slider');
 const speedValue = document.getElementById('speed-value');
 const chatInput = document.getElementById('chat-input');
@@ -46,6 +48,9 @@ const aiStatus = document.getElementById('ai-status');
 // Global variables
 let isConnected = false;
 let isStreaming = false;
+let frameObjectUrl = null; // Object URL of the currently displayed binary frame
+const supportsBinaryFrames = typeof Blob !== 'undefined' && typeof URL.createObjectURL === 'function';
+let peerConnection = null; // WebRTC connection, null while using the JPEG stream
 let currentSpeed = 50;
 let isChatVisible = false;
 let isRecording = false;
@@ -226,11 +231,23 @@ function setupSocketEvents() {
         }
     });
     
-    // Video frame events
-    socket.on('video_frame', (data) => {
+    // Video frame events (base64 fallback)
+    socket.on('video_frame', (data, ack) => {
+        const receivedAt = performance.now();
         if (data.frame) {
             videoFeed.src = 'data:image/jpeg;base64,' + data.frame;
         }
+        updateVideoTimestamp(data);
+        acknowledgeFrame(ack, receivedAt);
+    });
+    
+    // Binary video frame events - raw JPEG bytes arrive as an ArrayBuffer,
+    // followed by the frame metadata
+    socket.on('video_frame_binary', (data, meta, ack) => {
+        const receivedAt = performance.now();
+        renderBinaryFrame(data);
+        updateVideoTimestamp(meta);
+        acknowledgeFrame(ack, receivedAt);
     });
     
     // Voice response events
@@ -323,10 +340,14 @@ function fetchStatus() {
                 speedValue.textContent = currentSpeed;
             }
             
-            // Start video stream if available
+            // Start video stream if available. The JPEG stream gives a picture
+            // right away; WebRTC takes over once its track is playing.
             if (data.camera && !isStreaming) {
                 startVideoStream();
             }
+            if (data.camera && data.webrtc) {
+                startWebRTC(data.ice_servers || []);
+            }
         })
         .catch(error => {
             console.error('Error fetching status:', error);
@@ -367,7 +388,156 @@ function handleSpeedChange() {
 // Start video stream
 function startVideoStream() {
     if (!isStreaming) {
-        socket.emit('start_stream');
+        socket.emit('start_stream', { binary: supportsBinaryFrames });
+    }
+}
+
+// Tell the server the frame has been decoded so it sends the next one.
+// The server never has more than one unacknowledged frame in flight per
+// viewer, so a slow connection skips frames instead of queueing them.
+// The render report lets the server adapt quality to what we can display.
+function acknowledgeFrame(ack, receivedAt) {
+    if (typeof ack !== 'function') return;
+    
+    // Times are measured from the frame's arrival on the client's own clock,
+    // so the server can split the ack round trip without syncing clocks
+    const report = () => {
+        const decodedAt = performance.now();
+        if (document.hidden) {
+            // Hidden tabs do not paint, so there is no display time to wait for
+            ack({ rendered_at: decodedAt, decode_ms: decodedAt - receivedAt });
+            return;
+        }
+        requestAnimationFrame(() => {
+            const displayedAt = performance.now();
+            ack({
+                rendered_at: displayedAt,
+                decode_ms: decodedAt - receivedAt,
+                display_ms: displayedAt - receivedAt
+            });
+        });
+    };
+    
+    if (typeof videoFeed.decode === 'function') {
+        videoFeed.decode().then(report, report);
+    } else {
+        report();
+    }
+}
+
+// Negotiate a WebRTC video track, falling back to the JPEG stream on failure
+function startWebRTC(iceServers) {
+    if (peerConnection || typeof RTCPeerConnection === 'undefined') return;
+    
+    const pc = new RTCPeerConnection({ iceServers });
+    peerConnection = pc;
+    
+    pc.addTransceiver('video', { direction: 'recvonly' });
+    
+    pc.ontrack = (event) => {
+        videoWebRTC.srcObject = event.streams[0] || new MediaStream([event.track]);
+    };
+    
+    // Switch over once real video is flowing and stop paying for JPEGs
+    videoWebRTC.onplaying = () => {
+        if (peerConnection !== pc) return;
+        videoWebRTC.style.display = '';
+        videoFeed.style.display = 'none';
+        videoTimestamp.textContent = '';
+        stopVideoStream();
+    };
+    
+    pc.onconnectionstatechange = () => {
+        console.log('WebRTC connection state:', pc.connectionState);
+        if (peerConnection === pc &&
+            (pc.connectionState === 'failed' || pc.connectionState === 'closed')) {
+            stopWebRTC();
+        }
+    };
+    
+    pc.createOffer()
+        .then(offer => pc.setLocalDescription(offer))
+        .then(() => waitForIceGathering(pc))
+        .then(() => fetch('/api/webrtc/offer', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                sdp: pc.localDescription.sdp,
+                type: pc.localDescription.type
+            })
+        }))
+        .then(response => response.json())
+        .then(answer => {
+            if (!answer.success) {
+                throw new Error(answer.message || 'WebRTC offer rejected');
+            }
+            return pc.setRemoteDescription({ sdp: answer.sdp, type: answer.type });
+        })
+        .catch(error => {
+            console.error('WebRTC setup failed, using JPEG stream:', error);
+            stopWebRTC();
+        });
+}
+
+// The server does not support trickle ICE, so send the offer with all candidates
+function waitForIceGathering(pc) {
+    if (pc.iceGatheringState === 'complete') {
+        return Promise.resolve();
+    }
+    return new Promise(resolve => {
+        const check = () => {
+            if (pc.iceGatheringState === 'complete') {
+                pc.removeEventListener('icegatheringstatechange', check);
+                resolve();
+            }
+        };
+        pc.addEventListener('icegatheringstatechange', check);
+        // Do not wait forever for unreachable STUN servers
+        setTimeout(resolve, 2000);
+    });
+}
+
+// Tear down WebRTC and go back to the JPEG stream
+function stopWebRTC() {
+    if (peerConnection) {
+        peerConnection.close();
+        peerConnection = null;
+    }
+    videoWebRTC.style.display = 'none';
+    videoWebRTC.srcObject = null;
+    videoFeed.style.display = '';
+    if (isConnected) {
+        startVideoStream();
+    }
+}
+
+// Show the capture time when the server did not draw it into the frame
+function updateVideoTimestamp(meta) {
+    if (!meta || meta.annotated !== false || !meta.captured_at) {
+        videoTimestamp.textContent = '';
+        return;
+    }
+    
+    const date = new Date(meta.captured_at);
+    const pad = (n) => String(n).padStart(2, '0');
+    videoTimestamp.textContent = `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())} ` +
+        `${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}`;
+}
+
+// Display a raw JPEG frame without any base64 round trip
+function renderBinaryFrame(data) {
+    if (!data) return;
+    
+    const url = URL.createObjectURL(new Blob([data], { type: 'image/jpeg' }));
+    const previousUrl = frameObjectUrl;
+    frameObjectUrl = url;
+    videoFeed.src = url;
+    
+    // Release the previous frame's memory now that it has been replaced
+    if (previousUrl) {
+        URL.revokeObjectURL(previousUrl);
     }
 }
 
@@ -720,6 +890,9 @@ function toggleTTS() {
 window.addEventListener('beforeunload', () => {
     // Stop video stream
     stopVideoStream();
+    if (peerConnection) {
+        peerConnection.close();
+    }
     
     // Disconnect socket
     if (socket) {
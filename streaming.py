@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import base64
+import logging
+from threading import Lock, Condition, Thread
+from adaptive import AdaptiveStreamController
+from pacing import FramePacer
+from motion import MotionDetector
+from telemetry import LatencyTelemetry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Frames a viewer may have outstanding (sent but not yet acknowledged)
+MAX_IN_FLIGHT = 1
+# Assume a frame was lost if the client has not acknowledged it by then
+ACK_TIMEOUT = 1.0
+
+
+class EncodedFrame:
+    """
+    A single encoded video frame shared by every viewer.
+
+    The encoder's output buffer is kept as-is and exposed as a memoryview;
+    transports that need bytes (Socket.IO, WSGI) get one shared copy made on
+    first use instead of one per viewer.
+
+    Monotonic timestamps of when the frame was captured, when encoding
+    started and when it finished feed the latency telemetry.
+    """
+
+    def __init__(self, frame_id, buffer, quality=None, scale=1.0, captured_at=None, annotated=True,
+                 captured_monotonic=None, encode_started=None):
+        self.frame_id = frame_id
+        self.view = memoryview(buffer).cast('B')
+        self._jpeg = None
+        self.quality = quality
+        self.scale = scale
+        self.captured_at = captured_at or time.time()
+        self.annotated = annotated
+        self.encoded = time.monotonic()
+        self.encode_started = encode_started or self.encoded
+        self.captured_monotonic = captured_monotonic or self.encode_started
+        self._base64 = None
+        self._lock = Lock()
+
+    @property
+    def jpeg(self):
+        """JPEG data as bytes, copied from the encoder buffer at most once."""
+        with self._lock:
+            if self._jpeg is None:
+                self._jpeg = self.view.tobytes()
+            return self._jpeg
+
+    @property
+    def metadata(self):
+        """Per-frame metadata sent alongside the JPEG.
+
+        Clients draw the capture timestamp themselves when it has not been
+        drawn into the picture (native MJPEG passthrough).
+        """
+        return {
+            'id': self.frame_id,
+            'captured_at': int(self.captured_at * 1000),
+            'annotated': self.annotated
+        }
+
+    @property
+    def base64(self):
+        """Base64 text of the JPEG, computed at most once per frame."""
+        with self._lock:
+            if self._base64 is None:
+                self._base64 = base64.b64encode(self.view).decode('utf-8')
+            return self._base64
+
+
+def mjpeg_part(frame):
+    """One part of a multipart/x-mixed-replace MJPEG body."""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(frame.view)).encode() + b'\r\n'
+            b'X-Timestamp: ' + str(frame.metadata['captured_at']).encode() + b'\r\n\r\n' +
+            frame.jpeg + b'\r\n')
+
+
+class Viewer:
+    """
+    Per-subscriber delivery state.
+
+    Each viewer owns a one-slot mailbox. Offering a new frame while the
+    previous one is still waiting replaces it, so a slow viewer skips frames
+    instead of building up a send backlog that delays everyone else. An
+    AdaptiveStreamController picks the quality, scale and frame rate this
+    viewer's link can carry.
+    """
+
+    def __init__(self, broadcaster, sid, frame_format, config=None):
+        self.broadcaster = broadcaster
+        self.sid = sid
+        self.frame_format = frame_format
+        self.controller = AdaptiveStreamController(config)
+        self.pacer = FramePacer(self.controller.fps)
+        # Frames come from the capture thread; accept one up to half a
+        # capture interval early so capture jitter does not skip it
+        self.tolerance = 0.5 / max(1, broadcaster.config.CAMERA_FRAMERATE)
+        self.condition = Condition()
+        self.pending = None
+        self.in_flight = 0
+        self.in_flight_frame = None
+        self.last_send_time = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self.is_active = True
+        self.thread = None
+        # Optional callable run (with the viewer locked) when a frame is
+        # offered, so pull consumers can wait for frames without a thread
+        self.listener = None
+
+    def start(self):
+        """Start pushing frames to the client from a dedicated thread."""
+        self.thread = Thread(target=self._send_loop, name=f"viewer-{self.sid}")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def encoding(self):
+        """The (quality, scale) this viewer currently wants frames encoded at."""
+        return self.controller.quality, self.controller.scale
+
+    def is_due(self, now, advance=True):
+        """
+        Check whether this viewer's target frame rate allows another frame.
+
+        Only an advancing check uses up the frame slot; pass advance=False
+        while the frame may still be dropped.
+        """
+        with self.condition:
+            if self.controller.update(now):
+                self.pacer.set_fps(self.controller.fps)
+            return self.pacer.is_due(now, self.tolerance, advance)
+
+    def skip_unchanged(self):
+        """Note that a due frame was held back because the scene was static."""
+        with self.condition:
+            self.controller.record_gated()
+
+    def offer(self, frame):
+        """Place a frame in the mailbox, replacing any unsent one."""
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+                self.controller.record_drop()
+            self.pending = frame
+            self.condition.notify()
+            if self.listener is not None:
+                self.listener()
+
+    def acknowledge(self, *args):
+        """Socket.IO callback fired once the client has rendered a frame.
+
+        Clients may pass a report dict with their render timestamp and decode
+        and display times, which feeds the adaptive controller and the
+        latency telemetry.
+        """
+        with self.condition:
+            if self.in_flight:
+                now = time.monotonic()
+                report = args[0] if args else None
+                self.controller.record_ack(now - self.last_send_time, report)
+                if self.in_flight_frame is not None:
+                    self.broadcaster.telemetry.record_delivery(
+                        self.sid, self.in_flight_frame, self.last_send_time, now, report)
+                    self.in_flight_frame = None
+            self.in_flight = max(0, self.in_flight - 1)
+            self.condition.notify()
+
+    def close(self):
+        """Stop delivering frames to this viewer."""
+        with self.condition:
+            self.is_active = False
+            self.pending = None
+            self.condition.notify()
+
+    def _ready(self):
+        if not self.is_active:
+            return True
+        if self.in_flight and time.monotonic() - self.last_send_time > ACK_TIMEOUT:
+            # The acknowledgement was lost; do not stall the viewer forever
+            self.in_flight = 0
+            self.in_flight_frame = None
+            self.controller.record_timeout()
+        return self.pending is not None and self.in_flight < MAX_IN_FLIGHT
+
+    def _take_pending(self, timeout):
+        """Wait for a sendable frame and mark it in flight."""
+        with self.condition:
+            self.condition.wait_for(self._ready, timeout=timeout)
+            if not self.is_active:
+                return None
+            if self.pending is None or self.in_flight >= MAX_IN_FLIGHT:
+                return None
+            frame = self.pending
+            self.pending = None
+            self.in_flight += 1
+            self.in_flight_frame = frame
+            self.last_send_time = time.monotonic()
+            self.controller.record_send()
+            self.broadcaster.telemetry.record_emit(self.sid, frame, self.last_send_time)
+            return frame
+
+    def next_frame(self, timeout=ACK_TIMEOUT):
+        """
+        Pull the next frame for transports that write synchronously.
+
+        Asking for the next frame acknowledges the previous one: a pull-based
+        consumer only comes back once its last write has completed, so the
+        write time drives the adaptive controller like an ack round trip.
+
+        Returns:
+            EncodedFrame: The next frame, or None on timeout or when closed
+        """
+        self.acknowledge()
+        return self.take_frame(timeout)
+
+    def take_frame(self, timeout=0):
+        """
+        Take the pending frame for a pull-based consumer without
+        acknowledging the previous one; call acknowledge() once it is written.
+
+        Returns:
+            EncodedFrame: The pending frame, or None on timeout or when closed
+        """
+        frame = self._take_pending(timeout)
+        if frame is not None:
+            self.sent += 1
+        return frame
+
+    def _send_loop(self):
+        while self.is_active:
+            frame = self._take_pending(ACK_TIMEOUT)
+            if frame is None:
+                continue
+
+            try:
+                self.broadcaster.send(self, frame)
+                self.sent += 1
+            except Exception as e:
+                logger.error(f"Error sending frame to {self.sid}: {e}")
+                self.acknowledge()
+
+    def get_stats(self):
+        """Return delivery counters, pacing and encoder settings for this viewer."""
+        stats = {
+            'format': self.frame_format,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'in_flight': self.in_flight
+        }
+        stats.update(self.controller.get_settings())
+        # The controller's fps is the target; the pacer reports what was achieved
+        pacing = self.pacer.get_stats()
+        stats['achieved_fps'] = pacing['fps']
+        stats['jitter_ms'] = pacing['jitter_ms']
+        stats['skipped'] = pacing['skipped']
+        return stats
+
+
+class FrameBroadcaster:
+    """
+    Encode-once fan-out of camera frames to any number of viewers.
+
+    A single encoder thread pulls each new frame from the camera and offers
+    it to every subscribed viewer whose frame rate allows it. Each distinct
+    (quality, scale) setting in use is encoded once per frame and shared.
+    Frames of a static scene are dropped before encoding by a MotionDetector.
+    Subscriptions are reference counted: capture starts with the first viewer
+    and stops when the last one leaves.
+    """
+
+    def __init__(self, socketio, camera, recorder=None):
+        self.socketio = socketio
+        self.camera = camera
+        self.recorder = recorder
+        self.config = camera.config
+        self.lock = Lock()
+        self.viewers = {}
+        self.motion = MotionDetector(self.config)
+        self.telemetry = LatencyTelemetry()
+        self.encoder_thread = None
+        self.is_streaming = False
+        # Bumped on every start so a lingering encoder thread from a previous
+        # session exits instead of running alongside the new one
+        self.generation = 0
+
+    def subscribe(self, sid, frame_format='binary'):
+        """
+        Subscribe a client to the stream.
+
+        Args:
+            sid (str): Socket.IO session id of the client, or any unique id
+                for pull-based viewers
+            frame_format (str): 'binary' for raw JPEG bytes, 'base64', or
+                'pull' for consumers that fetch frames with next_frame()
+
+        Returns:
+            int: Number of viewers after subscribing
+        """
+        with self.lock:
+            previous = self.viewers.pop(sid, None)
+            if previous:
+                previous.close()
+
+            viewer = Viewer(self, sid, frame_format, self.config)
+            self.viewers[sid] = viewer
+            if frame_format != 'pull':
+                viewer.start()
+            # A new viewer needs a picture even if nothing is moving
+            self.motion.force()
+
+            if not self.is_streaming:
+                self._start()
+            logger.info(f"Viewer {sid} subscribed ({frame_format}), {len(self.viewers)} watching")
+            return len(self.viewers)
+
+    def unsubscribe(self, sid):
+        """
+        Unsubscribe a client. Capture stops when the last viewer leaves.
+
+        Returns:
+            int: Number of viewers after unsubscribing
+        """
+        with self.lock:
+            viewer = self.viewers.pop(sid, None)
+            if viewer:
+                viewer.close()
+                self.telemetry.remove_viewer(sid)
+                logger.info(f"Viewer {sid} unsubscribed, {len(self.viewers)} watching")
+            if not self.viewers and self.is_streaming:
+                self._stop()
+            return len(self.viewers)
+
+    def get_viewer(self, sid):
+        """Return the Viewer for a subscription, or None."""
+        with self.lock:
+            return self.viewers.get(sid)
+
+    def mjpeg_stream(self, viewer_id):
+        """
+        Generate a multipart/x-mixed-replace MJPEG body.
+
+        The viewer shares the regular capture/encode pipeline; each extra
+        MJPEG client only costs the socket writes for its own frames. The
+        subscription is dropped as soon as the HTTP client goes away.
+        """
+        self.subscribe(viewer_id, 'pull')
+        viewer = self.get_viewer(viewer_id)
+        try:
+            while viewer.is_active:
+                frame = viewer.next_frame()
+                if frame is None:
+                    continue
+                yield mjpeg_part(frame)
+        finally:
+            self.unsubscribe(viewer_id)
+
+    def is_subscribed(self, sid):
+        """Check whether a client is currently watching."""
+        with self.lock:
+            return sid in self.viewers
+
+    def viewer_count(self):
+        """Number of currently subscribed viewers."""
+        with self.lock:
+            return len(self.viewers)
+
+    def send(self, viewer, frame):
+        """Deliver a frame to a single viewer in its requested format."""
+        if viewer.frame_format == 'binary':
+            # Raw bytes travel as a Socket.IO binary attachment
+            self.socketio.emit('video_frame_binary', (frame.jpeg, frame.metadata),
+                               to=viewer.sid, callback=viewer.acknowledge)
+        else:
+            data = {'frame': frame.base64}
+            data.update(frame.metadata)
+            self.socketio.emit('video_frame', data, to=viewer.sid,
+                               callback=viewer.acknowledge)
+
+    def get_stats(self):
+        """Return per-viewer delivery statistics."""
+        with self.lock:
+            return {sid: viewer.get_stats() for sid, viewer in self.viewers.items()}
+
+    def _start(self):
+        self.is_streaming = True
+        self.generation += 1
+        self.camera.start()
+        self.encoder_thread = Thread(target=self._encode_loop, args=(self.generation,),
+                                     name="frame-broadcaster")
+        self.encoder_thread.daemon = True
+        self.encoder_thread.start()
+        logger.info("Frame broadcaster started")
+
+    def _stop(self):
+        self.is_streaming = False
+        self.camera.stop()
+        logger.info("Frame broadcaster stopped")
+
+    def _encode_loop(self, generation):
+        last_frame_id = 0
+        while self.is_streaming and self.generation == generation:
+            try:
+                # wait_for_frame blocks until the capture thread publishes a
+                # new frame, so the loop runs at the camera's real frame rate
+                frame_id, raw = self.camera.wait_for_frame(last_frame_id)
+                if raw is None:
+                    continue
+                last_frame_id = frame_id
+                try:
+                    self._broadcast_frame(frame_id, raw)
+                finally:
+                    self.camera.release_frame(raw)
+            except Exception as e:
+                logger.error(f"Video streaming error: {e}")
+                if self.recorder:
+                    self.recorder.dump('stream-error')
+                self.socketio.emit('error', {'message': f'Video streaming error: {str(e)}'})
+                time.sleep(0.1)
+
+    def _broadcast_frame(self, frame_id, raw):
+        """Encode a held camera frame for the viewers that are due and offer it."""
+        now = time.monotonic()
+        captured_at, captured_monotonic = self.camera.capture_timestamps(frame_id)
+
+        with self.lock:
+            viewers = list(self.viewers.values())
+        due = [viewer for viewer in viewers if viewer.is_due(now, advance=False)]
+        if not due:
+            return
+
+        # Nothing changed since the last frame we sent: skip the encode and
+        # the sends entirely. The frame slots stay unused, so the pacers
+        # only count frames that actually went out.
+        if not self.motion.should_send(raw, now):
+            for viewer in due:
+                viewer.skip_unchanged()
+            return
+        due = [viewer for viewer in due if viewer.is_due(now)]
+
+        frames = {}
+        for viewer in due:
+            quality, scale = viewer.encoding()
+            frame = frames.get((quality, scale))
+            if frame is None:
+                encode_started = time.monotonic()
+                buffer = self.camera.encode(frame_id, raw, quality, scale)
+                if buffer is None:
+                    continue
+                frame = EncodedFrame(frame_id, buffer, quality, scale,
+                                     captured_at, self.camera.is_annotated(),
+                                     captured_monotonic, encode_started)
+                self.telemetry.record_encode(frame)
+                frames[(quality, scale)] = frame
+            viewer.offer(frame)
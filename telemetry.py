@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+from collections import deque
+from threading import Lock
+
+# Upper bucket edges in milliseconds; the last bucket is open ended
+BUCKET_EDGES_MS = (5, 10, 20, 35, 50, 75, 100, 150, 200, 300, 500, 1000)
+# Samples kept per histogram
+WINDOW = 512
+
+# Stages of the video path, in the order a frame passes through them
+STAGES = ('capture', 'encode', 'queue', 'network', 'decode', 'display', 'glass_to_glass')
+
+
+class LatencyHistogram:
+    """Rolling latency histogram over the most recent samples."""
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def get_stats(self):
+        """Return percentiles and bucket counts of the samples in the window."""
+        samples = sorted(self.samples)
+        if not samples:
+            return {'count': self.count, 'samples': 0}
+
+        buckets = [0] * (len(BUCKET_EDGES_MS) + 1)
+        for ms in samples:
+            buckets[bisect.bisect_right(BUCKET_EDGES_MS, ms)] += 1
+        labels = [f"<{edge}" for edge in BUCKET_EDGES_MS] + [f">={BUCKET_EDGES_MS[-1]}"]
+        n = len(samples)
+        return {
+            'count': self.count,
+            'samples': n,
+            'mean': round(sum(samples) / n, 2),
+            'p50': round(samples[int(n * 0.5)], 2),
+            'p90': round(samples[int(n * 0.9)], 2),
+            'p99': round(samples[min(n - 1, int(n * 0.99))], 2),
+            'max': round(samples[-1], 2),
+            'buckets': dict(zip(labels, buckets))
+        }
+
+
+class LatencyTelemetry:
+    """
+    Per-stage and per-viewer latency of the video path.
+
+    Server-side stages are measured on the monotonic clock: capture (frame
+    captured until encoding starts), encode, and queue (encoded until handed
+    to the transport). The client reports how long decoding and displaying
+    took after the frame arrived, so the one-way network time can be
+    estimated from the acknowledgement round trip without comparing clocks:
+
+        network = (round trip - client time) / 2
+        glass_to_glass = capture -> emit + network + client time
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.viewers = {}  # sid -> {stage: LatencyHistogram}
+
+    def _record(self, sid, stage, seconds):
+        ms = max(0.0, seconds * 1000.0)
+        self.stages[stage].record(ms)
+        if sid is not None:
+            viewer = self.viewers.setdefault(sid, {})
+            viewer.setdefault(stage, LatencyHistogram()).record(ms)
+
+    def record_encode(self, frame):
+        """Record the shared capture and encode stages of an EncodedFrame."""
+        with self.lock:
+            self._record(None, 'capture', frame.encode_started - frame.captured_monotonic)
+            self._record(None, 'encode', frame.encoded - frame.encode_started)
+
+    def record_emit(self, sid, frame, emitted):
+        """Record how long a frame waited between encoding and being sent."""
+        with self.lock:
+            self._record(sid, 'queue', emitted - frame.encoded)
+
+    def record_delivery(self, sid, frame, emitted, acknowledged, report=None):
+        """
+        Record the client side of a delivered frame.
+
+        Args:
+            sid (str): Viewer the frame was sent to
+            frame (EncodedFrame): The frame that was acknowledged
+            emitted (float): Monotonic time the frame was handed to the transport
+            acknowledged (float): Monotonic time the acknowledgement arrived
+            report (dict): Optional client report with 'decode_ms' and
+                'display_ms', both measured from the frame's arrival
+        """
+        report = report if isinstance(report, dict) else {}
+        decode_ms = report.get('decode_ms')
+        display_ms = report.get('display_ms')
+        decode_ms = decode_ms if isinstance(decode_ms, (int, float)) else None
+        display_ms = display_ms if isinstance(display_ms, (int, float)) else None
+        client = (display_ms if display_ms is not None else decode_ms or 0.0) / 1000.0
+
+        round_trip = acknowledged - emitted
+        network = max(0.0, round_trip - client) / 2
+        with self.lock:
+            self._record(sid, 'network', network)
+            if decode_ms is not None:
+                self._record(sid, 'decode', decode_ms / 1000.0)
+            if display_ms is not None and decode_ms is not None:
+                self._record(sid, 'display', (display_ms - decode_ms) / 1000.0)
+            self._record(sid, 'glass_to_glass',
+                         emitted - frame.captured_monotonic + network + client)
+
+    def remove_viewer(self, sid):
+        """Forget the histograms of a viewer that left."""
+        with self.lock:
+            self.viewers.pop(sid, None)
+
+    def get_stats(self):
+        """Return histograms per stage and per viewer."""
+        with self.lock:
+            return {
+                'stages': {stage: hist.get_stats() for stage, hist in self.stages.items()},
+                'viewers': {sid: {stage: hist.get_stats() for stage, hist in stages.items()}
+                            for sid, stages in self.viewers.items()}
+            }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import pytest
+from control import ControlReceiver, FLAG_DRIVE, FLAG_STOP, decode, encode, is_newer
+
+
+def test_round_trip():
+    message = decode(encode(7, 1234, FLAG_DRIVE, vx=0.5, vy=-1.0, omega=0.0, pan=10, tilt=-5))
+    assert message.seq == 7
+    assert message.flags == FLAG_DRIVE
+    assert round(message.vx, 2) == 0.5
+    assert message.vy == -1.0
+    assert (message.pan, message.tilt) == (10, -5)
+
+
+def test_malformed_frame_is_rejected():
+    with pytest.raises(ValueError):
+        decode(b'\x01\x02')
+
+
+def test_sequence_wraps():
+    assert is_newer(0, (1 << 32) - 1)
+    assert not is_newer((1 << 32) - 1, 0)
+
+
+def test_stale_frame_is_dropped():
+    applied = []
+    receiver = ControlReceiver({FLAG_DRIVE: lambda sid, message: applied.append(message.seq)})
+
+    assert receiver.receive('a', encode(2, 0, FLAG_DRIVE, vx=1.0))
+    assert receiver.receive('a', encode(1, 0, FLAG_DRIVE, vx=-1.0)) is None
+    assert applied == [2]
+    assert receiver.get_stats()['stale'] == 1
+
+
+def test_stop_dispatches_before_drive():
+    order = []
+    receiver = ControlReceiver({FLAG_STOP: lambda sid, message: order.append('stop'),
+                                FLAG_DRIVE: lambda sid, message: order.append('drive')})
+    receiver.receive('a', encode(1, 0, FLAG_DRIVE | FLAG_STOP))
+    assert order == ['stop', 'drive']
+
+
+def test_out_of_order_handler_threads():
+    applied = []
+    first_dispatching = threading.Event()
+
+    def drive(sid, message):
+        if message.seq == 1:
+            # Still dispatching frame 1 when the thread with frame 2 runs
+            first_dispatching.set()
+            threading.Event().wait(0.1)
+        applied.append(message.seq)
+
+    receiver = ControlReceiver({FLAG_DRIVE: drive})
+
+    def second():
+        first_dispatching.wait(timeout=1.0)
+        receiver.receive('a', encode(2, 20, FLAG_DRIVE, vx=1.0))
+
+    threads = [threading.Thread(target=receiver.receive, args=('a', encode(1, 0, FLAG_DRIVE))),
+               threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2.0)
+
+    # The newer frame is applied last, so its setpoint wins
+    assert applied == [1, 2]
+
+
+def test_clients_do_not_block_each_other():
+    applied = []
+    receiver = ControlReceiver({FLAG_DRIVE: lambda sid, message: applied.append((sid, message.seq))})
+    receiver.receive('a', encode(5, 0, FLAG_DRIVE))
+    receiver.receive('b', encode(1, 0, FLAG_DRIVE))
+    receiver.remove('a')
+    receiver.receive('a', encode(1, 0, FLAG_DRIVE))
+    assert applied == [('a', 5), ('b', 1), ('a', 1)]
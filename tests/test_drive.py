@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from drive import InputCoalescer
+
+
+def test_late_handler_cannot_override_newer_input():
+    applied = []
+    inputs = InputCoalescer(applied.append)
+
+    # Two handlers start in arrival order but finish the other way round
+    first = inputs.receive('a')
+    second = inputs.receive('a')
+    assert inputs.offer('a', 'right', ticket=second)
+    assert not inputs.offer('a', 'forward', ticket=first)
+
+    assert applied == ['right']
+    stats = inputs.get_stats()
+    assert stats['stale'] == 1
+    assert stats['clients']['a'] == {'received': 2, 'stale': 1}
+
+
+def test_late_stop_is_still_applied():
+    applied = []
+    inputs = InputCoalescer(applied.append)
+
+    stop = inputs.receive('a')
+    drive = inputs.receive('a')
+    inputs.offer('a', 'forward', ticket=drive)
+    assert inputs.offer('a', 'stop', urgent=True, ticket=stop)
+
+    # The stop did not move the client forward in time
+    assert not inputs.offer('a', 'left', ticket=stop)
+    assert applied == ['forward', 'stop']
+
+
+def test_clients_are_ordered_independently():
+    applied = []
+    inputs = InputCoalescer(applied.append)
+
+    old = inputs.receive('a')
+    inputs.offer('a', 'forward')
+    inputs.offer('b', 'left', ticket=inputs.receive('b'))
+
+    assert not inputs.offer('a', 'backward', ticket=old)
+    assert applied == ['forward', 'left']
+
+
+def test_out_of_order_handler_threads():
+    applied = []
+    inputs = InputCoalescer(applied.append)
+    newer_done = threading.Event()
+
+    def slow_handler(ticket):
+        # Still parsing when the next input is handled and applied
+        newer_done.wait(timeout=1.0)
+        inputs.offer('a', 'forward', ticket=ticket)
+
+    def fast_handler(ticket):
+        inputs.offer('a', 'right', ticket=ticket)
+        newer_done.set()
+
+    threads = [threading.Thread(target=slow_handler, args=(inputs.receive('a'),)),
+               threading.Thread(target=fast_handler, args=(inputs.receive('a'),))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2.0)
+
+    assert applied == ['right']
+    assert inputs.get_stats()['applied'] == 1
+
+
+def test_remove_forgets_the_client():
+    inputs = InputCoalescer(lambda intent: None)
+    inputs.offer('a', 'forward')
+    inputs.remove('a')
+    assert 'a' not in inputs.get_stats()['clients']
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import logging
+import threading
+import numpy as np
+from av import VideoFrame
+from aiortc import (RTCPeerConnection, RTCSessionDescription, RTCConfiguration,
+                    RTCIceServer, RTCRtpSender, VideoStreamTrack)
+from aiortc.mediastreams import MediaStreamError, VIDEO_CLOCK_RATE, VIDEO_TIME_BASE
+from config import Config
+from pacing import FramePacer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# How long a signalling request may take before we give up
+SIGNALLING_TIMEOUT = 15.0
+
+
+class CameraVideoTrack(VideoStreamTrack):
+    """
+    A WebRTC video track fed by Camera's capture thread.
+
+    Frames are handed to aiortc as raw pixels; aiortc encodes them with
+    VP8 or H.264 and adapts the bitrate with its congestion control.
+    """
+
+    kind = "video"
+
+    def __init__(self, camera):
+        super().__init__()
+        self.camera = camera
+        self.last_frame_id = 0
+        self.last_frame = None
+        self.is_capturing = False
+        self.pacer = FramePacer(camera.config.STREAM_FPS_MAX)
+        self.start_time = None
+
+    async def next_timestamp(self):
+        """
+        Wait for the next frame deadline and return its presentation time.
+
+        Replaces aiortc's fixed 30 fps clock with the shared pacer so the
+        track runs at the configured rate and skips slots when it falls
+        behind instead of sending a burst of late frames.
+        """
+        if self.readyState != "live":
+            raise MediaStreamError
+        delay = self.pacer.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        return int((now - self.start_time) * VIDEO_CLOCK_RATE), VIDEO_TIME_BASE
+
+    async def recv(self):
+        if not self.is_capturing:
+            self.camera.start()
+            self.is_capturing = True
+
+        pts, time_base = await self.next_timestamp()
+
+        # Waiting for the capture thread blocks, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        frame_id, frame = await loop.run_in_executor(
+            None, self.camera.wait_for_image, self.last_frame_id, 1.0)
+        if frame is not None:
+            self.last_frame_id = frame_id
+            self.last_frame = frame
+        elif self.last_frame is not None:
+            # Repeat the last picture rather than stall the encoder
+            frame = self.last_frame
+        else:
+            frame = self._blank_frame()
+
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
+        video_frame.pts = pts
+        video_frame.time_base = time_base
+        return video_frame
+
+    def _blank_frame(self):
+        return np.zeros((self.camera.config.CAMERA_HEIGHT,
+                         self.camera.config.CAMERA_WIDTH, 3), dtype=np.uint8)
+
+    def stop(self):
+        super().stop()
+        if self.is_capturing:
+            self.is_capturing = False
+            self.camera.stop()
+
+
+class WebRTCManager:
+    """
+    WebRTC signalling and peer connection management.
+
+    aiortc is asyncio based while the rest of the server is threaded, so the
+    manager runs its own event loop in a background thread. Flask handlers
+    submit offers to that loop and wait for the answer.
+    """
+
+    def __init__(self, camera):
+        """Initialize the WebRTC manager with configuration settings."""
+        self.config = Config()
+        self.camera = camera
+        self.peer_connections = {}  # RTCPeerConnection -> CameraVideoTrack
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="webrtc-loop")
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f"WebRTC manager initialized (codec: {self.config.WEBRTC_CODEC})")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def get_ice_servers(self):
+        """ICE servers to use on both ends of the connection."""
+        if not self.config.STUN_SERVER:
+            return []
+        return [{'urls': self.config.STUN_SERVER}]
+
+    def handle_offer(self, sdp, sdp_type='offer'):
+        """
+        Answer an SDP offer from a browser.
+
+        Args:
+            sdp (str): The offer SDP
+            sdp_type (str): SDP type, always 'offer' from our client
+
+        Returns:
+            dict: {'sdp': ..., 'type': 'answer'}
+        """
+        future = asyncio.run_coroutine_threadsafe(self._handle_offer(sdp, sdp_type), self.loop)
+        return future.result(timeout=SIGNALLING_TIMEOUT)
+
+    async def _handle_offer(self, sdp, sdp_type):
+        ice_servers = [RTCIceServer(urls=server['urls']) for server in self.get_ice_servers()]
+        pc = RTCPeerConnection(RTCConfiguration(iceServers=ice_servers))
+        track = CameraVideoTrack(self.camera)
+        self.peer_connections[pc] = track
+
+        @pc.on("connectionstatechange")
+        async def on_connectionstatechange():
+            logger.info(f"WebRTC connection state: {pc.connectionState}")
+            if pc.connectionState in ("failed", "closed"):
+                await self._close(pc)
+
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type=sdp_type))
+
+        # Attach our track to the browser's recvonly video transceiver
+        transceiver = None
+        for t in pc.getTransceivers():
+            if t.kind == "video":
+                transceiver = t
+                break
+        if transceiver is None:
+            await self._close(pc)
+            raise ValueError("Offer does not contain a video section")
+
+        pc.addTrack(track)
+        self._prefer_codec(transceiver)
+
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+        return {'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type}
+
+    def _prefer_codec(self, transceiver):
+        """Put the configured codec first in the negotiation."""
+        preferred = self.config.WEBRTC_CODEC.upper()
+        codecs = RTCRtpSender.getCapabilities("video").codecs
+        ordered = sorted(codecs, key=lambda c: c.mimeType.upper() != f"VIDEO/{preferred}")
+        transceiver.setCodecPreferences(ordered)
+
+    async def _close(self, pc):
+        track = self.peer_connections.pop(pc, None)
+        if track:
+            track.stop()
+            await pc.close()
+
+    def connection_count(self):
+        """Number of live peer connections."""
+        return len(self.peer_connections)
+
+    def get_stats(self):
+        """Return pacing statistics for each live track."""
+        return {str(id(pc)): track.pacer.get_stats()
+                for pc, track in list(self.peer_connections.items())}
+
+    def close(self):
+        """Close every peer connection and stop the event loop."""
+        async def close_all():
+            for pc in list(self.peer_connections):
+                await self._close(pc)
+        try:
+            asyncio.run_coroutine_threadsafe(close_all(), self.loop).result(timeout=5.0)
+        except Exception as e:
+            logger.error(f"Error closing WebRTC connections: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)